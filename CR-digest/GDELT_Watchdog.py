@@ -1,13 +1,17 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import pandas_gbq
 from google.cloud import bigquery 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import os
+import time
 import logging
 import json
-import difflib
-import sys
+import threading
+from watchdog_store import WatchdogStore
 
 # --- CONFIGURATION ---
 KEYWORDS = '("climate change" OR "ecocide" OR "cop30")'
@@ -15,9 +19,25 @@ KEYWORDS = '("climate change" OR "ecocide" OR "cop30")'
 # Region to search
 TARGET_COUNTRY = ["US", "BR", "UK"]
 
+# Keyword/country pairs to watch; all are fetched concurrently
+SEARCHES = [(KEYWORDS, TARGET_COUNTRY)]
+
 # Similarity Threshold (0.0 to 1.0)
 SIMILARITY_THRESHOLD = 0.85
 
+# --- FETCH CONFIGURATION ---
+# GDELT returns at most 250 articles per request: a slice that comes back full is split until it fits
+MAX_RECORDS = 250
+LOOKBACK = timedelta(hours=24)       # First run of a search (no watermark yet)
+WATERMARK_OVERLAP = timedelta(hours=1)  # Re-read before the watermark: GDELT can index articles late
+MAX_CATCHUP = timedelta(days=90)     # The DOC API only searches the last 3 months
+INITIAL_SLICE = timedelta(hours=6)
+MIN_SLICE = timedelta(minutes=15)  # GDELT publishes in 15-minute updates; smaller slices gain nothing
+FETCH_WORKERS = 4
+MIN_REQUEST_INTERVAL = 5.0  # Seconds between two requests across all threads (GDELT asks for one every 5s)
+GDELT_TIME_FORMAT = "%Y%m%d%H%M%S"
+SEENDATE_FORMAT = "%Y%m%dT%H%M%SZ"
+
 # --- STORAGE CONFIGURATION ---
 DATA_FILE = "./download/global_news_cop30_data.csv"
 
@@ -39,10 +59,33 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+class RateLimiter:
+    """Spaces out calls from all threads by at least min_interval seconds."""
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
 class GdeltWatchdog:
-    def __init__(self, filepath):
+    def __init__(self, filepath, store_path=None):
         self.filepath = filepath
         self.base_url = "https://api.gdeltproject.org/api/v2/doc/doc"
+        # Title index (and later runs' state) lives next to the CSV: ./download/<name>.db
+        self.store = WatchdogStore(store_path or os.path.splitext(filepath)[0] + ".db", SIMILARITY_THRESHOLD)
+        # One pooled session for every slice; retries back off on rate limiting and server errors
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; NewsWatchdog/1.0)'
+        retries = Retry(total=3, backoff_factor=5, status_forcelist=[429, 500, 502, 503, 504])
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=FETCH_WORKERS, max_retries=retries))
+        self.rate_limiter = RateLimiter(MIN_REQUEST_INTERVAL)
 
     def build_query(self, keywords, country=None):
         query = keywords
@@ -55,75 +98,131 @@ class GdeltWatchdog:
         query += " sourcelang:eng"
         return query
 
-    def fetch_articles(self, query):
-        headers = {'User-Agent': 'Mozilla/5.0 (compatible; NewsWatchdog/1.0)'}
+    def fetch_articles(self, query, start, end):
         params = {
             'query': query,
             'mode': 'artlist',
-            'maxrecords': 250,
-            'timespan': '24h',
+            'maxrecords': MAX_RECORDS,
+            'startdatetime': start.strftime(GDELT_TIME_FORMAT),
+            'enddatetime': end.strftime(GDELT_TIME_FORMAT),
             'format': 'json',
             'sort': 'DateDesc'
         }
 
         try:
-            logging.info(f"Querying GDELT with: {query}")
-            response = requests.get(self.base_url, params=params, headers=headers, timeout=15)
+            self.rate_limiter.wait()
+            logging.info(f"Querying GDELT with: {query} [{start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M}]")
+            response = self.session.get(self.base_url, params=params, timeout=30)
             response.raise_for_status()
             try:
                 data = response.json()
                 return data.get('articles', [])
             except json.JSONDecodeError:
                 logging.error("API returned invalid JSON.")
-                return []
+                return None
         except requests.exceptions.RequestException as e:
             logging.error(f"API Request Failed: {e}")
-            return []
+            return None
 
-    def get_existing_data(self):
-        if not os.path.exists(self.filepath):
-            return set(), []
-        try:
-            if os.path.getsize(self.filepath) == 0:
-                return set(), []
-            df = pd.read_csv(self.filepath, usecols=['url', 'title'])
-            existing_urls = set(df['url'].unique())
-            existing_titles = df['title'].dropna().astype(str).tolist()
-            return existing_urls, existing_titles
-        except Exception as e:
-            logging.critical(f"CRITICAL ERROR: Could not read local CSV. Error: {e}")
-            sys.exit(1)
+    def fetch_window(self, windows):
+        """
+        Fetches every article for a list of (query, start, end) windows (UTC datetimes).
+        Each window starts as slices of INITIAL_SLICE. A slice that returns MAX_RECORDS articles
+        may have lost some, so it is split in half and both halves are fetched, down to MIN_SLICE.
+        Returns the articles (deduplicated by URL, newest first) and the newest seendate per query;
+        a query with a failed request gets no seendate, so its watermark does not skip the gap.
+        """
+        slices = []
+        for query, start, end in windows:
+            count = max(1, -(-(end - start) // INITIAL_SLICE))
+            step = (end - start) / count
+            slices += [(query, start + i * step, start + (i + 1) * step) for i in range(count)]
+        articles, newest, failed, request_count = {}, {}, set(), 0
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            futures = {pool.submit(self.fetch_articles, *s): s for s in slices}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    query, slice_start, slice_end = futures.pop(future)
+                    batch = future.result()
+                    request_count += 1
+                    if batch is None:
+                        failed.add(query)
+                        continue
+                    for art in batch:
+                        if art.get('url'): articles.setdefault(art['url'], art)
+                        if art.get('seendate', '') > newest.get(query, ''): newest[query] = art['seendate']
+                    if len(batch) < MAX_RECORDS:
+                        continue
+                    if slice_end - slice_start <= MIN_SLICE:
+                        logging.warning(f"{slice_start:%Y-%m-%d %H:%M} - {slice_end:%H:%M} still returns {MAX_RECORDS} articles; some may be missing.")
+                        continue
+                    middle = slice_start + (slice_end - slice_start) / 2
+                    for part in ((query, slice_start, middle), (query, middle, slice_end)):
+                        futures[pool.submit(self.fetch_articles, *part)] = part
 
-    def is_duplicate_title(self, new_title, existing_titles):
+        merged = sorted(articles.values(), key=lambda art: art.get('seendate', ''), reverse=True)
+        logging.info(f"Fetched {len(merged)} unique articles in {request_count} requests.")
+        return merged, {query: seendate for query, seendate in newest.items() if query not in failed}
+
+    def plan_window(self, query, end):
+        """Starts WATERMARK_OVERLAP before the newest seendate already processed, or LOOKBACK back on the first run."""
+        mark = self.store.get_watermark(query)
+        if mark is None:
+            return query, end - LOOKBACK, end
+        start = datetime.strptime(mark, SEENDATE_FORMAT).replace(tzinfo=timezone.utc) - WATERMARK_OVERLAP
+        return query, max(start, end - MAX_CATCHUP), end
+
+    def import_existing_data(self, chunksize=10000):
+        """
+        One-off: loads the URLs and titles of an existing CSV into the store. Later runs only use the store.
+        Reads in chunks and keeps whatever it could read if the file is damaged.
+        """
+        if self.store.get_meta("csv_imported"): return
+        if os.path.exists(self.filepath) and os.path.getsize(self.filepath) > 0:
+            imported = 0
+            try:
+                for chunk in pd.read_csv(self.filepath, usecols=['url', 'title'], chunksize=chunksize,
+                                         on_bad_lines='skip', encoding_errors='replace'):
+                    self.store.add_urls(chunk['url'].dropna().astype(str))
+                    self.store.add_titles(chunk['title'].dropna().astype(str))
+                    imported += len(chunk)
+            except Exception as e:
+                logging.error(f"Could not read all of the local CSV, continuing with {imported} rows. Error: {e}")
+            logging.info(f"Imported {imported} existing rows into {self.store.path}")
+        self.store.set_meta("csv_imported", datetime.now().isoformat())
+        self.store.commit()
+
+    def is_duplicate_title(self, new_title):
         if not new_title: return False
-        if new_title in existing_titles: return True
-        for existing in reversed(existing_titles):
-            ratio = difflib.SequenceMatcher(None, new_title, existing).ratio()
-            if ratio > SIMILARITY_THRESHOLD:
-                logging.info(f"Skipping duplicate content: '{new_title}' ~ '{existing}' ({ratio:.2f})")
-                return True
-        return False
+        match = self.store.find_similar_title(new_title)
+        if not match: return False
+        existing, ratio = match
+        if ratio < 1.0:
+            logging.info(f"Skipping duplicate content: '{new_title}' ~ '{existing}' ({ratio:.2f})")
+        return True
 
     def process_articles(self, articles):
         if not articles:
             return pd.DataFrame()
 
-        existing_urls, existing_titles = self.get_existing_data()
+        self.import_existing_data()
         new_records = []
         skipped_count = 0
 
-        logging.info(f"Processing {len(articles)} fetched articles against {len(existing_titles)} existing records...")
+        logging.info(f"Processing {len(articles)} fetched articles against {self.store.path}...")
 
         for art in articles:
             url = art.get('url')
             title = art.get('title')
 
-            if url in existing_urls or self.is_duplicate_title(title, existing_titles):
+            if not url or self.store.is_seen_url(url) or self.is_duplicate_title(title):
                 skipped_count += 1
                 continue
 
-            existing_titles.append(title)
-            existing_urls.add(url)
+            # Uncommitted until the run has saved the rows, but already visible to the rest of this run
+            self.store.add_urls([url])
+            if title: self.store.add_titles([title])
 
             record = {
                 'title': title,
@@ -146,13 +245,16 @@ class GdeltWatchdog:
         return pd.DataFrame(new_records)
 
     def save_to_csv(self, df):
-        if df.empty: return
+        """Returns True once the rows are on disk, False if the write failed."""
+        if df.empty: return True
         write_header = not os.path.exists(self.filepath)
         try:
             df.to_csv(self.filepath, mode='a', header=write_header, index=False)
             logging.info(f"CSV: Saved {len(df)} new rows.")
+            return True
         except Exception as e:
             logging.error(f"Failed to write to CSV: {e}")
+            return False
 
     def ensure_dataset_exists(self):
         try:
@@ -177,15 +279,24 @@ class GdeltWatchdog:
             logging.error(f"BigQuery Upload Failed: {e}")
 
     def run(self):
-        query = self.build_query(KEYWORDS, TARGET_COUNTRY)
-        articles = self.fetch_articles(query)
+        end = datetime.now(timezone.utc)
+        windows = [self.plan_window(self.build_query(keywords, country), end) for keywords, country in SEARCHES]
+        articles, newest = self.fetch_window(windows)
         df_new = self.process_articles(articles)
         
-        if not df_new.empty:
-            self.save_to_csv(df_new)
+        if df_new.empty:
+            logging.info("No new unique articles found.")
+        elif self.save_to_csv(df_new):
             self.save_to_bigquery(df_new)
         else:
-            logging.info("No new unique articles found.")
+            # Nothing was written: forget this run's URLs/titles and keep the watermarks where they were,
+            # so the next run fetches the same window again
+            self.store.rollback()
+            return
+        # The new URLs/titles and the watermarks only move once the rows are written out
+        for query, seendate in newest.items():
+            self.store.set_watermark(query, seendate)
+        self.store.commit()
 
 if __name__ == "__main__":
     logging.info("--- Starting Daily GDELT Watchdog ---")
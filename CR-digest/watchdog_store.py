@@ -0,0 +1,143 @@
+"""
+Persistent state for the GDELT watchdog, kept in one SQLite file next to the CSV.
+
+Watermarks: newest GDELT seendate processed per search, so the next run starts from there.
+
+Seen URLs: one row per canonical URL (primary-key lookups), so a run no longer rereads the CSV.
+
+Title index: near-duplicate titles are found with MinHash LSH over character shingles.
+Every stored title is written into BANDS buckets; a new title is only compared (with the
+difflib ratio) against titles sharing at least one bucket, so the cost per lookup stays
+flat however long the history gets.
+"""
+import zlib
+import sqlite3
+import hashlib
+import difflib
+import numpy as np
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+SHINGLE_SIZE = 4
+NUM_PERM = 60
+BANDS = 20                  # 20 bands x 3 rows: titles with shingle Jaccard above ~0.37 very likely share a bucket
+ROWS = NUM_PERM // BANDS
+
+# Fixed hash permutations (a * x + b mod p), so signatures stay comparable between runs
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+
+# Query parameters that only track the click, not the article
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ocid", "cmpid", "smid")
+
+
+def canonical_url(url):
+    """Same article, same key: https, lower-case host without www., no fragment, tracking parameters or trailing slash."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."): host = host[4:]
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                       if not k.lower().startswith(TRACKING_PARAMS)])
+    scheme = "https" if parts.scheme.lower() in ("http", "https") else parts.scheme.lower()
+    return urlunsplit((scheme, host, parts.path.rstrip("/") or "/", query, ""))
+
+
+def title_buckets(title):
+    """MinHash signature of the title's character shingles, folded into one 64-bit bucket key per band."""
+    text = " ".join(title.lower().split())
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+    signature = (((hashes[:, None] * _A + _B) % _MERSENNE_PRIME) & _MAX_HASH).min(axis=0)
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * ROWS:(band + 1) * ROWS].tobytes(),
+                                       digest_size=8).digest(), "big", signed=True)
+        for band in range(BANDS)
+    ]
+
+
+class WatchdogStore:
+    def __init__(self, path, similarity_threshold=0.85):
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS title (id INTEGER PRIMARY KEY, title TEXT NOT NULL UNIQUE);
+            CREATE TABLE IF NOT EXISTS title_bucket (bucket INTEGER NOT NULL, title_id INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS title_bucket_idx ON title_bucket (bucket);
+            CREATE TABLE IF NOT EXISTS seen_url (url TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS watermark (search TEXT PRIMARY KEY, seendate TEXT NOT NULL, updated_at TEXT);
+        """)
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # --- WATERMARKS ---
+    def get_watermark(self, search):
+        """Newest seendate processed for this search ("20251115T123000Z"), or None before the first run."""
+        row = self.conn.execute("SELECT seendate FROM watermark WHERE search = ?", (search,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, search, seendate):
+        """Moves the mark forward only (seendates sort as strings). Part of the open transaction until commit()."""
+        self.conn.execute("""
+            INSERT INTO watermark (search, seendate, updated_at) VALUES (?, ?, datetime('now'))
+            ON CONFLICT(search) DO UPDATE SET seendate = max(seendate, excluded.seendate), updated_at = excluded.updated_at
+        """, (search, seendate))
+
+    # --- URLS ---
+    def url_count(self):
+        return self.conn.execute("SELECT count(*) FROM seen_url").fetchone()[0]
+
+    def is_seen_url(self, url):
+        return self.conn.execute("SELECT 1 FROM seen_url WHERE url = ?", (canonical_url(url),)).fetchone() is not None
+
+    def add_urls(self, urls):
+        """Marks URLs as seen. Part of the open transaction until commit()."""
+        self.conn.executemany("INSERT OR IGNORE INTO seen_url (url) VALUES (?)", [(canonical_url(u),) for u in urls])
+
+    # --- TITLES ---
+    def title_count(self):
+        return self.conn.execute("SELECT count(*) FROM title").fetchone()[0]
+
+    def find_similar_title(self, title):
+        """Returns (existing title, ratio) for the first stored title above the threshold, else None."""
+        if self.conn.execute("SELECT 1 FROM title WHERE title = ?", (title,)).fetchone():
+            return title, 1.0
+        buckets = title_buckets(title)
+        candidates = self.conn.execute(
+            f"SELECT DISTINCT t.title FROM title_bucket b JOIN title t ON t.id = b.title_id "
+            f"WHERE b.bucket IN ({','.join('?' * len(buckets))})", buckets
+        ).fetchall()
+        for (existing,) in candidates:
+            matcher = difflib.SequenceMatcher(None, title, existing)
+            # Cheap upper bounds first; ratio() is the expensive part
+            if matcher.real_quick_ratio() > self.similarity_threshold and matcher.quick_ratio() > self.similarity_threshold:
+                ratio = matcher.ratio()
+                if ratio > self.similarity_threshold:
+                    return existing, ratio
+        return None
+
+    def add_titles(self, titles):
+        """Indexes titles (already known ones are ignored). Part of the open transaction until commit()."""
+        for title in titles:
+            cursor = self.conn.execute("INSERT OR IGNORE INTO title (title) VALUES (?)", (title,))
+            if cursor.rowcount:
+                self.conn.executemany("INSERT INTO title_bucket (bucket, title_id) VALUES (?, ?)",
+                                      [(bucket, cursor.lastrowid) for bucket in title_buckets(title)])
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+HTTP service around ClimateLitigationAgent (case categories + suggested laws).
+The artifacts are loaded once at startup. Concurrent requests are collected into micro-batches:
+the batcher waits at most --max-wait-ms after the first queued description (or until --max-batch
+descriptions are queued) and answers them all with one predict_batch() call.
+
+Usage:
+    python agent_server.py --port 8091 --max-batch 64 --max-wait-ms 10
+
+Endpoints:
+    POST /predict  {"description": "...", "top_k_laws": 3}
+                   {"descriptions": ["...", "..."], "top_k_laws": 3}
+    GET  /health   process is up
+    GET  /ready    200 once the artifacts are loaded and warmed up, 503 before
+    GET  /metrics  Prometheus text (latency, queue depth, batch size)
+"""
+
+from flask import Flask, request, jsonify, Response
+from flask_cors import CORS
+import time
+import queue
+import argparse
+import threading
+import traceback
+import logging
+from datetime import datetime
+from concurrent.futures import Future, TimeoutError as FuturesTimeout
+
+from climate_agent_pipeline import ClimateLitigationAgent
+from retrieval_metrics import MetricsRegistry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+CORS(app)
+
+# Defaults, overridden from the command line
+MAX_BATCH = 64            # descriptions per predict_batch() call
+MAX_WAIT = 0.010          # seconds the batcher waits for more requests after the first one
+MAX_QUEUE = 2048          # queued descriptions before new requests get 429
+REQUEST_TIMEOUT = 30.0    # seconds before a request gives up with 504
+MAX_DESCRIPTIONS = 256    # descriptions per request
+MAX_TOP_K = 10
+
+# Global state, filled in by warm_up()
+agent = None
+metrics = MetricsRegistry()
+state = {"ready": False, "error": None, "started_at": datetime.now().isoformat(), "ready_at": None}
+
+
+class MicroBatcher:
+    """
+    Single worker thread that drains a queue of (description, top_k, future) into predict_batch() calls.
+    Batching pays off because spaCy, the SetFit body and the embedding model all run faster per text on a batch.
+    """
+
+    def __init__(self, predict_batch, max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT, max_queue: int = MAX_QUEUE):
+        self.predict_batch = predict_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._submit_lock = threading.Lock()  # a request's descriptions are queued all or nothing
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, descriptions, top_k: int):
+        """Queues the descriptions; returns one Future per description. Raises queue.Full when the queue is full."""
+        futures = []
+        with self._submit_lock:
+            # Only submitters add to the queue, so the room checked here is still there for the puts below
+            if self.queue.qsize() + len(descriptions) > self.queue.maxsize:
+                raise queue.Full
+            for description in descriptions:
+                future = Future()
+                self.queue.put_nowait((description, top_k, future, time.perf_counter()))
+                futures.append(future)
+        metrics.set_gauge("agent_queue_depth", self.queue.qsize())
+        return futures
+
+    def _collect(self):
+        # Block for the first item, then keep taking items until the batch is full or the window closes
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            metrics.set_gauge("agent_queue_depth", self.queue.qsize())
+            metrics.set_gauge("agent_last_batch_size", len(batch))
+            metrics.inc("agent_batches_total")
+            metrics.inc("agent_batch_items_total", len(batch))
+
+            start = time.perf_counter()
+            try:
+                # One call for the whole batch at the largest top_k; suggested laws are sorted, so the rest is a slice
+                results = self.predict_batch([item[0] for item in batch], top_k_laws=max(item[1] for item in batch))
+            except Exception as e:
+                logger.error(f"Error in predict_batch: {e}")
+                logger.error(traceback.format_exc())
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            metrics.observe("predict_batch", done - start, engine="agent")
+
+            for (_, top_k, future, queued_at), result in zip(batch, results):
+                if "suggested_laws" in result:
+                    result["suggested_laws"] = result["suggested_laws"][:top_k]
+                metrics.observe("queue_wait", start - queued_at, engine="agent")
+                future.set_result(result)
+
+
+batcher = None
+
+
+def warm_up(model_dir, use_quantized=True, law_index_mode="exact"):
+    """Loads the classifier, embedding model and law index once and runs a first prediction."""
+    global agent, batcher
+    try:
+        start = time.perf_counter()
+        logger.info("🚀 Loading ClimateLitigationAgent artifacts...")
+        agent = ClimateLitigationAgent(model_dir=model_dir, use_quantized=use_quantized, law_index_mode=law_index_mode)
+        if agent.category_model is None:
+            logger.warning("⚠️ No trained classifier found; categories will read 'Model not loaded/trained'.")
+        if agent.law_embeddings is None:
+            logger.warning("⚠️ No law index found; suggested_laws will be empty.")
+
+        logger.info("🔥 Warming up...")
+        agent.predict_batch(["Challenge to the approval of a coal-fired power plant."])
+
+        batcher = MicroBatcher(agent.predict_batch, max_batch=MAX_BATCH, max_wait=MAX_WAIT, max_queue=MAX_QUEUE)
+        state["ready"] = True
+        state["ready_at"] = datetime.now().isoformat()
+        logger.info(f"✅ Agent ready in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        state["error"] = str(e)
+        logger.error(f"❌ Warmup failed: {e}")
+        logger.error(traceback.format_exc())
+
+
+@app.route('/predict', methods=['POST'])
+def handle_predict():
+    """
+    Categories and suggested laws for one description ({"description"}) or several ({"descriptions"}).
+    Each result carries "latency_ms": time from arrival to answer, queueing included.
+    """
+    start = time.perf_counter()
+    if not state["ready"]:
+        return jsonify({"error": "Agent is still warming up"}), 503
+    data = request.get_json(silent=True) or {}
+    single = "descriptions" not in data
+    descriptions = [data.get("description")] if single else data.get("descriptions")
+    if not isinstance(descriptions, list) or not all(isinstance(d, str) and d.strip() for d in descriptions) or not descriptions:
+        return jsonify({"error": "Provide a non-empty 'description' or list of 'descriptions'"}), 400
+    if len(descriptions) > MAX_DESCRIPTIONS:
+        return jsonify({"error": f"At most {MAX_DESCRIPTIONS} descriptions per request"}), 400
+    top_k = max(1, min(int(data.get("top_k_laws", 3)), MAX_TOP_K))
+
+    try:
+        futures = batcher.submit([d.strip() for d in descriptions], top_k)
+    except queue.Full:
+        metrics.inc("server_rejected_total", reason="busy")
+        return jsonify({"error": "Server busy, try again later"}), 429
+
+    results = []
+    deadline = start + REQUEST_TIMEOUT
+    try:
+        for future in futures:
+            results.append(future.result(timeout=max(0.0, deadline - time.perf_counter())))
+    except FuturesTimeout:
+        metrics.inc("server_rejected_total", reason="timeout")
+        return jsonify({"error": f"Request took longer than {REQUEST_TIMEOUT:.0f}s"}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    latency = time.perf_counter() - start
+    metrics.observe("request", latency, engine="agent")
+    for result in results:
+        result["latency_ms"] = round(1000 * latency, 2)
+    return jsonify(results[0] if single else {"results": results})
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process answers."""
+    return jsonify({"status": "ok", "started_at": state["started_at"]})
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: only 200 once the artifacts are loaded."""
+    body = {"ready": state["ready"], "ready_at": state["ready_at"], "error": state["error"],
+            "queue_depth": batcher.queue.qsize() if batcher else 0}
+    return jsonify(body), 200 if state["ready"] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.to_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve ClimateLitigationAgent predictions over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--model-dir", default="climate_agent_artifacts")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="Descriptions per predict_batch() call")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000, help="Batching window after the first queued request")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE, help="Queued descriptions before returning 429")
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT, help="Seconds before a request fails with 504")
+    parser.add_argument("--full-precision", action="store_true", help="Ignore the int8 export and use the fp32 models")
+    parser.add_argument("--law-index", choices=["exact", "hnsw", "ivf"], default="exact", help="Law search mode")
+    parser.add_argument("--metrics-log-interval", type=float, default=0, help="Log a JSON metrics snapshot every N seconds (0 = off)")
+    args = parser.parse_args()
+
+    MAX_BATCH = args.max_batch
+    MAX_WAIT = args.max_wait_ms / 1000
+    MAX_QUEUE = args.max_queue
+    REQUEST_TIMEOUT = args.request_timeout
+    if args.metrics_log_interval > 0:
+        metrics.start_json_logging(args.metrics_log_interval)
+
+    print("⚖️ Climate Litigation Agent Server")
+    print("=" * 50)
+    # Load in the background so /health answers straight away and /ready flips when done
+    threading.Thread(target=warm_up, args=(args.model_dir, not args.full_precision, args.law_index), daemon=True).start()
+
+    print(f"🔗 http://{args.host}:{args.port}")
+    print("📚 API endpoints:")
+    print("   • POST /predict - Categories + suggested laws (one or many descriptions)")
+    print("   • GET /health, /ready, /metrics")
+    print("=" * 50)
+
+    app.run(host=args.host, port=args.port, debug=False, use_reloader=False, threaded=True)
@@ -0,0 +1,93 @@
+### Runs a file of research questions through the hybrid engine and writes one JSON line per answer.
+### Usage: python batch_ask.py questions.txt answers.jsonl --concurrency 8 --engine policy
+import os
+import json
+import argparse
+import logging
+from dotenv import load_dotenv
+from hybrid_retrieval_engine import HybridRetrievalEngine
+from retrieval_policy import PolicyAwareRetrievalEngine
+from graph_snapshot import GraphSnapshot
+
+
+load_dotenv()
+
+## Config (MUST MATCH THE BUILDER SCRIPT!)
+PINECONE_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_INDEX = "climate-rights-agent-nollm"
+NEO4J_URI = "neo4j+s://0dc47c9f.databases.neo4j.io"
+NEO4J_AUTH = ("neo4j", os.getenv("NEO_API_KEY"))
+GOOGLE_KEY = os.getenv("GOOGLE_API_KEY")
+EMBEDDING_TYPE = "google"
+
+ENGINES = {
+    "hybrid": HybridRetrievalEngine,
+    "policy": PolicyAwareRetrievalEngine,
+}
+
+def parse_stage_model(value, timeout):
+    """'ollama:llama3.2:1b' -> stage_models entry that falls back to the main LLM."""
+    provider, _, model = value.partition(":")
+    return {"provider": provider, "model": model, "timeout": timeout, "fallback": "default"}
+
+def load_questions(filepath):
+    """Reads one question per line, skipping blank lines and '#' comments."""
+    with open(filepath, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+def write_results(results, filepath):
+    with open(filepath, "w", encoding="utf-8") as f:
+        for res in results:
+            f.write(json.dumps(res, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch questions through the Hybrid Retrieval Engine")
+    parser.add_argument("questions", help="Text file with one question per line")
+    parser.add_argument("output", help="JSONL file to write the answers to")
+    parser.add_argument("--engine", choices=ENGINES.keys(), default="policy", help="Which engine to use")
+    parser.add_argument("--concurrency", type=int, default=4, help="Max simultaneous LLM calls")
+    parser.add_argument("--top-k", type=int, default=5, help="Vector matches per question")
+    parser.add_argument("--ollama", action="store_true", help="Use local Ollama instead of Gemini")
+    parser.add_argument("--extraction-model", help="provider:model for entity extraction, e.g. ollama:llama3.2:1b")
+    parser.add_argument("--synthesis-model", help="provider:model for synthesis, e.g. gemini:gemini-2.5-pro")
+    parser.add_argument("--stage-timeout", type=float, default=30.0, help="Seconds before a routed stage falls back to the main LLM")
+    parser.add_argument("--graph-snapshot", help="Answer graph lookups from this snapshot file (see graph_snapshot.py)")
+    parser.add_argument("--metrics-file", help="Write stage latency histograms + token counts here (Prometheus text)")
+    parser.add_argument("--metrics-log-interval", type=float, default=0, help="Log a JSON metrics snapshot every N seconds (0 = off)")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    if not questions:
+        print(f"❌ No questions found in {args.questions}.")
+        exit()
+
+    stage_models = {}
+    if args.extraction_model:
+        stage_models["entity_extraction"] = parse_stage_model(args.extraction_model, args.stage_timeout)
+    if args.synthesis_model:
+        stage_models["synthesis"] = parse_stage_model(args.synthesis_model, args.stage_timeout)
+
+    engine = ENGINES[args.engine](
+        pinecone_api_key=PINECONE_KEY,
+        pinecone_index_name=PINECONE_INDEX,
+        neo4j_uri=NEO4J_URI,
+        neo4j_auth=NEO4J_AUTH,
+        google_api_key=GOOGLE_KEY,
+        use_ollama=args.ollama,
+        embedding_model_type=EMBEDDING_TYPE,
+        graph_snapshot=GraphSnapshot(args.graph_snapshot) if args.graph_snapshot else None,
+        stage_models=stage_models
+    )
+
+    if args.metrics_log_interval > 0:
+        engine.metrics.start_json_logging(args.metrics_log_interval)
+    results = engine.ask_many(questions, concurrency=args.concurrency, top_k=args.top_k)
+    engine.metrics.stop_json_logging()
+    write_results(results, args.output)
+
+    failed = sum(1 for res in results if res["error"])
+    logging.info(f"Wrote {len(results)} answers to {args.output} ({failed} failed).")
+    if args.metrics_file:
+        engine.metrics.write_prometheus(args.metrics_file)
+        logging.info(f"Metrics written to {args.metrics_file}")
+    engine.driver.close()
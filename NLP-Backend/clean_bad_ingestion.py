@@ -1,4 +1,7 @@
 import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pinecone import Pinecone
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
@@ -11,51 +14,137 @@ NEO4J_URI = "neo4j+s://0dc47c9f.databases.neo4j.io"
 NEO4J_AUTH = ("neo4j", "ZG-TEicS5P4dROrWdaGrS7avHTymG1OLlihxq3J3hKQ")
 
 # IMPORTANT: Set this to the name of the index where the bad data went
-PINECONE_INDEX_NAME = "climate-rights-agent-nollm" 
+PINECONE_INDEX_NAME = "climate-rights-agent-nollm"
 
 # Name of the file containing the IDs to delete (one per line)
 BAD_IDS_FILE = "bad_ids.txt"
+CHECKPOINT_FILE = "ingestion_checkpoint.txt"
+
+# Labels the ingestion writes an `id` onto (see knowledge_graph_builder.py)
+RECORD_LABELS = ("CourtCase", "Policy")
+GRAPH_BATCH_SIZE = 500      # ids per Neo4j write transaction
+VECTOR_BATCH_SIZE = 100     # ids per Pinecone delete/fetch call (Pinecone limits ids per request)
+VECTOR_WORKERS = 8
+VERIFY_RETRIES = 3          # Pinecone deletes are eventually consistent; re-check (and re-send) this often
 
 def load_bad_ids(filepath):
     """Reads IDs from a text file."""
     if not os.path.exists(filepath):
         print(f"❌ Error: File '{filepath}' not found. Please create it and paste the bad IDs there.")
         return []
-    
+
     with open(filepath, "r") as f:
-        # Read lines, strip whitespace/newlines, ignore empty lines
-        ids = [line.strip() for line in f.readlines() if line.strip()]
-    
+        # Read lines, strip whitespace/newlines, ignore empty lines (and duplicates, keeping the order)
+        ids = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
     print(f"📄 Loaded {len(ids)} IDs from {filepath}")
     return ids
 
-def clean_up():
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# --- NEO4J ---
+def ensure_id_indexes(driver):
+    """Range indexes on :CourtCase(id) and :Policy(id), so deletes are index seeks instead of full scans."""
+    with driver.session() as session:
+        for label in RECORD_LABELS:
+            session.run(f"CREATE INDEX {label.lower()}_id IF NOT EXISTS FOR (n:{label}) ON (n.id)")
+        session.run("CALL db.awaitIndexes(300)")
+
+def purge_graph(driver, ids, batch_size=GRAPH_BATCH_SIZE):
+    """
+    Deletes the records per label with one UNWIND query per batch, each batch in its own transaction
+    (bounded memory on the server, and a failure only rolls back that batch). Returns {label: deleted}.
+    The entities the records pointed to get e.touched_at, so orphan_gc.py only has to check those.
+    """
+    deleted = {}
+    with driver.session() as session:
+        for label in RECORD_LABELS:
+            query = f"""
+                UNWIND $ids AS id
+                MATCH (n:{label} {{id: id}})
+                CALL {{
+                    WITH n
+                    MATCH (n)-->(e:Entity)
+                    SET e.touched_at = timestamp()
+                }}
+                DETACH DELETE n
+                RETURN count(*) AS deleted
+            """
+            deleted[label] = 0
+            for batch in _chunks(ids, batch_size):
+                deleted[label] += session.execute_write(lambda tx: tx.run(query, ids=batch).single()["deleted"])
+    return deleted
+
+# --- PINECONE ---
+def _fetch_existing(index, ids):
+    return list(index.fetch(ids=ids).vectors.keys())
+
+def purge_vectors(index, ids, batch_size=VECTOR_BATCH_SIZE, workers=VECTOR_WORKERS):
+    """
+    Sends the deletes in concurrent chunks, then bulk-fetches the ids to check they are gone.
+    Vectors still present are deleted again (up to VERIFY_RETRIES times). Returns the ids that survived.
+    """
+    # Cases are stored under their raw ID, policies as "policy_<id>"; delete both to be thorough
+    remaining = ids + [f"policy_{x}" for x in ids]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda batch: index.delete(ids=batch), _chunks(remaining, batch_size)))
+        print(f"   - Sent {len(remaining)} deletes in {-(-len(remaining) // batch_size)} batches")
+
+        for attempt in range(1, VERIFY_RETRIES + 1):
+            time.sleep(attempt)
+            remaining = [x for found in pool.map(lambda batch: _fetch_existing(index, batch), _chunks(remaining, batch_size)) for x in found]
+            if not remaining:
+                break
+            print(f"   - {len(remaining)} vectors still present, re-sending (check {attempt}/{VERIFY_RETRIES})")
+            list(pool.map(lambda batch: index.delete(ids=batch), _chunks(remaining, batch_size)))
+    return remaining
+
+# --- CHECKPOINT ---
+def purge_checkpoint(filepath, ids):
+    """
+    Drops the ids from the checkpoint file. Writes to a temp file next to it and swaps it in with
+    os.replace, so an interrupted run never leaves a half-written checkpoint. Returns the lines removed.
+    """
+    if not os.path.exists(filepath):
+        print("⚠️ Checkpoint file not found.")
+        return 0
+    bad_ids_set = set(ids)
+    removed = 0
+    tmp_path = f"{filepath}.tmp"
+    with open(filepath, "r") as src, open(tmp_path, "w") as dst:
+        for line in src:
+            if line.strip() in bad_ids_set:
+                removed += 1
+            else:
+                dst.write(line)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp_path, filepath)
+    return removed
+
+def clean_up(ids_file=BAD_IDS_FILE, checkpoint_file=CHECKPOINT_FILE, graph_batch_size=GRAPH_BATCH_SIZE,
+             vector_batch_size=VECTOR_BATCH_SIZE, workers=VECTOR_WORKERS):
     # 1. Load IDs
-    bad_ids = load_bad_ids(BAD_IDS_FILE)
+    bad_ids = load_bad_ids(ids_file)
     if not bad_ids:
         print("No IDs to clean. Exiting.")
         return
 
     print(f"🚨 STARTING SURGICAL DELETION OF {len(bad_ids)} RECORDS 🚨")
+    start = time.perf_counter()
 
     # 2. Delete from PINECONE
     print(f"\n--- 1. Cleaning Pinecone ({PINECONE_INDEX_NAME}) ---")
     try:
         pc = Pinecone(api_key=PINECONE_KEY)
         index = pc.Index(PINECONE_INDEX_NAME)
-        
-        # We delete both raw IDs and "policy_" prefixed IDs to be thorough
-        prefixed_ids = [f"policy_{x}" for x in bad_ids]
-        all_targets = bad_ids + prefixed_ids
-        
-        # Batching deletes (Pinecone has a limit per request)
-        batch_size = 100
-        for i in range(0, len(all_targets), batch_size):
-            batch = all_targets[i:i + batch_size]
-            index.delete(ids=batch)
-            print(f"   - Sent delete batch {(i // batch_size) + 1}")
-            
-        print(f"✅ Cleanup commands sent for {len(all_targets)} potential vectors.")
+        survivors = purge_vectors(index, bad_ids, batch_size=vector_batch_size, workers=workers)
+        if survivors:
+            print(f"⚠️ {len(survivors)} vectors still present after {VERIFY_RETRIES} checks: {survivors[:10]}")
+        else:
+            print(f"✅ Verified: none of the {len(bad_ids) * 2} candidate vector IDs remain.")
     except Exception as e:
         print(f"❌ Pinecone Error: {e}")
 
@@ -63,41 +152,34 @@ def clean_up():
     print(f"\n--- 2. Cleaning Neo4j ---")
     try:
         driver = GraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH)
-        with driver.session() as session:
-            for item_id in bad_ids:
-                # This query deletes ANY node with this ID, whether it's a Policy or CourtCase
-                # It also deletes any relationships connected to it (DETACH)
-                query = "MATCH (n {id: $id}) DETACH DELETE n"
-                session.run(query, id=item_id)
-                print(f"   - Deleted Node ID: {item_id}")
-        driver.close()
-        print("✅ Neo4j cleanup complete.")
+        try:
+            ensure_id_indexes(driver)
+            deleted = purge_graph(driver, bad_ids, batch_size=graph_batch_size)
+        finally:
+            driver.close()
+        print(f"✅ Neo4j cleanup complete: {', '.join(f'{n} {label}' for label, n in deleted.items())} nodes deleted.")
     except Exception as e:
         print(f"❌ Neo4j Error: {e}")
 
     # 4. Clean the CHECKPOINT FILE
     print(f"\n--- 3. Cleaning Checkpoint File ---")
-    checkpoint_file = "ingestion_checkpoint.txt"
-    if os.path.exists(checkpoint_file):
-        with open(checkpoint_file, "r") as f:
-            lines = f.readlines()
-        
-        # Filter out the bad IDs (stripped for accurate matching)
-        bad_ids_set = set(bad_ids)
-        clean_lines = [line for line in lines if line.strip() not in bad_ids_set]
-        
-        with open(checkpoint_file, "w") as f:
-            f.writelines(clean_lines)
-        
-        removed_count = len(lines) - len(clean_lines)
-        print(f"✅ Removed {removed_count} lines from {checkpoint_file}.")
-    else:
-        print("⚠️ Checkpoint file not found.")
+    removed_count = purge_checkpoint(checkpoint_file, bad_ids)
+    print(f"✅ Removed {removed_count} lines from {checkpoint_file}.")
+    print(f"\n🏁 Done in {time.perf_counter() - start:.1f}s. Next: python orphan_gc.py, and refresh the graph snapshot if you use one (graph_snapshot.py refresh rebuilds it after a purge).")
 
 if __name__ == "__main__":
-    print(f"This script will read IDs from '{BAD_IDS_FILE}' and delete them from Pinecone, Neo4j, and the checkpoint.")
-    confirm = input("Are you sure you want to proceed? (yes/no): ")
+    parser = argparse.ArgumentParser(description="Delete bad ingestion IDs from Pinecone, Neo4j and the checkpoint")
+    parser.add_argument("--ids-file", default=BAD_IDS_FILE, help="File with one ID per line")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--graph-batch-size", type=int, default=GRAPH_BATCH_SIZE, help="IDs per Neo4j transaction")
+    parser.add_argument("--vector-batch-size", type=int, default=VECTOR_BATCH_SIZE, help="IDs per Pinecone call")
+    parser.add_argument("--workers", type=int, default=VECTOR_WORKERS, help="Concurrent Pinecone calls")
+    parser.add_argument("--yes", action="store_true", help="Skip the confirmation prompt")
+    args = parser.parse_args()
+
+    print(f"This script will read IDs from '{args.ids_file}' and delete them from Pinecone, Neo4j, and the checkpoint.")
+    confirm = "yes" if args.yes else input("Are you sure you want to proceed? (yes/no): ")
     if confirm.lower() == "yes":
-        clean_up()
+        clean_up(args.ids_file, args.checkpoint, args.graph_batch_size, args.vector_batch_size, args.workers)
     else:
-        print("Operation cancelled.")
\ No newline at end of file
+        print("Operation cancelled.")
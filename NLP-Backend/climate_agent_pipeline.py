@@ -3,35 +3,71 @@ import spacy
 import logging
 import joblib  # <--- Added for saving the Label Encoder
 import os
-from typing import List, Dict, Tuple, Union
+import copy
+import time
+import hashlib
+import json
+import numpy as np
+from typing import List, Dict, Optional, Tuple, Union
 from sklearn.preprocessing import MultiLabelBinarizer
 from datasets import Dataset
 from setfit import SetFitModel, SetFitTrainer
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
 from sentence_transformers.losses import CosineSimilarityLoss
 import torch
 
+try:
+    import faiss  # Optional: only needed for law_index_mode="hnsw" / "ivf"
+except ImportError:
+    faiss = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Cleaning only needs lemmas + stop words: tok2vec, tagger, attribute_ruler and lemmatizer stay on
+CLEAN_DISABLED_PIPES = ["parser", "ner", "senter"]
+# Bump when clean_text / parse_list_column change, so cached corpora are rebuilt
+PREPARED_CACHE_VERSION = 1
+# Bump when the layout of the persisted law index changes
+LAW_INDEX_VERSION = 1
+# Sentence-transformer body the category classifier starts from
+SETFIT_BASE_MODEL = "sentence-transformers/paraphrase-mpnet-base-v2"
+# File name SetFit uses for the classification head inside a saved model directory
+SETFIT_HEAD_FILE = "model_head.pkl"
+# ANN settings for the law index (inner product on normalized vectors = cosine)
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 8
+
 class ClimateLitigationAgent:
     """
     An AI Agent capable of analyzing climate litigation texts.
     Now supports SAVING and LOADING to avoid retraining.
     """
 
-    def __init__(self, embedding_model_name: str = "all-MiniLM-L6-v2", model_dir: str = "climate_agent_artifacts"):
+    def __init__(self, embedding_model_name: str = "all-MiniLM-L6-v2", model_dir: str = "climate_agent_artifacts",
+                 use_quantized: bool = True, law_index_mode: str = "exact"):
         """
         Args:
             embedding_model_name: HuggingFace model ID for embeddings (used for Law Retrieval).
             model_dir: Directory to save/load the trained classification model.
+            use_quantized: Serve with the int8 encoders from export_quantized() when they exist.
+            law_index_mode: "exact" (brute-force dot product), or "hnsw" / "ivf" (FAISS ANN index, built once and persisted).
         """
         logger.info("Initializing ClimateLitigationAgent...")
         
         self.model_dir = model_dir
         self.classifier_path = os.path.join(model_dir, "category_classifier")
         self.encoder_path = os.path.join(model_dir, "label_binarizer.joblib")
+        self.prepared_dir = os.path.join(model_dir, "prepared")
+        self.law_index_dir = os.path.join(model_dir, "law_index")
+        self.embedding_model_name = embedding_model_name
+        self.use_quantized = use_quantized
+        self.law_index_mode = law_index_mode
+        if law_index_mode != "exact" and faiss is None:
+            logger.warning("faiss is not installed (pip install faiss-cpu). Using the exact law index.")
+            self.law_index_mode = "exact"
 
         # Load NLP model for cleaning
         try:
@@ -44,22 +80,38 @@ class ClimateLitigationAgent:
 
         # Load Embedding Model for Law Retrieval (RAG)
         self.embedding_model = SentenceTransformer(embedding_model_name)
+        self._fp32_encoder = None  # only loaded when embedding_model is the int8 one, see _index_encoder()
         
         # Components
         self.category_model = None
         self.category_binarizer = None 
         self.law_embeddings = None
+        self.law_ann = None
         self.law_list = [] 
 
         # Attempt to load existing model on startup
         if os.path.exists(self.classifier_path) and os.path.exists(self.encoder_path):
             self.load_resources()
+        else:
+            self._load_quantized()
+        self.load_law_index()
 
     def clean_text(self, text: str) -> str:
-        if not isinstance(text, str): return ""
-        doc = self.nlp(text)
-        tokens = [token.lemma_ for token in doc if not token.is_stop and not token.is_punct and len(token.text) > 2]
-        return " ".join(tokens)
+        return self.clean_texts([text])[0]
+
+    def clean_texts(self, texts: List[str], batch_size: int = 256, n_process: int = 1) -> List[str]:
+        """
+        Batched clean_text: one nlp.pipe pass with the unneeded components disabled.
+        n_process > 1 spreads the batches over worker processes (worth it from a few thousand texts).
+        """
+        texts = [text if isinstance(text, str) else "" for text in texts]
+        disabled = [name for name in CLEAN_DISABLED_PIPES if name in self.nlp.pipe_names]
+        cleaned = []
+        with self.nlp.select_pipes(disable=disabled):
+            for doc in self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+                tokens = [token.lemma_ for token in doc if not token.is_stop and not token.is_punct and len(token.text) > 2]
+                cleaned.append(" ".join(tokens))
+        return cleaned
 
     def parse_list_column(self, text: str, separator: str = '|') -> List[str]:
         if pd.isna(text): return []
@@ -67,18 +119,72 @@ class ClimateLitigationAgent:
         items = [item.strip() for item in text.split(separator)]
         return [item for item in items if item]
 
-    def load_and_prepare_data(self, filepath: str) -> pd.DataFrame:
+    @staticmethod
+    def _file_hash(filepath: str) -> str:
+        sha = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def _prepared_cache_path(self, filepath: str, source_hash: str) -> str:
+        stem = os.path.splitext(os.path.basename(filepath))[0]
+        spacy_version = self.nlp.meta.get("version", "unknown")
+        key = hashlib.sha256(f"{source_hash}|{spacy_version}|{PREPARED_CACHE_VERSION}".encode()).hexdigest()[:16]
+        return os.path.join(self.prepared_dir, f"{stem}_{key}.parquet")
+
+    def load_and_prepare_data(self, filepath: str, use_cache: bool = True, n_process: int = None) -> pd.DataFrame:
+        """
+        Reads the CSV and adds clean_description, parsed_categories and parsed_laws.
+        The derived columns are cached as parquet, keyed by the CSV's hash (+ spaCy model version),
+        so retraining and index rebuilds on unchanged data skip the spaCy pass.
+        """
         logger.info(f"Loading data from {filepath}...")
         df = pd.read_csv(filepath)
-        df['clean_description'] = df['Description'].apply(self.clean_text)
+        derived = ['clean_description', 'parsed_categories', 'parsed_laws']
+
+        cache_path = None
+        if use_cache:
+            cache_path = self._prepared_cache_path(filepath, self._file_hash(filepath))
+            if os.path.exists(cache_path):
+                try:
+                    cached = pd.read_parquet(cache_path)
+                    if len(cached) == len(df):
+                        df['clean_description'] = cached['clean_description'].tolist()
+                        df['parsed_categories'] = [list(v) for v in cached['parsed_categories']]
+                        df['parsed_laws'] = [list(v) for v in cached['parsed_laws']]
+                        logger.info(f"♻️ Loaded cleaned corpus from {cache_path}")
+                        return df
+                except Exception as e:
+                    logger.warning(f"Could not read cached corpus ({e}). Re-cleaning...")
+
+        if n_process is None:
+            n_process = min(4, os.cpu_count() or 1) if len(df) >= 2000 else 1
+        df['clean_description'] = self.clean_texts(df['Description'].tolist(), n_process=n_process)
         df['parsed_categories'] = df['Case Categories'].apply(lambda x: self.parse_list_column(x, separator='|'))
         df['parsed_laws'] = df['Principal Laws'].apply(lambda x: self.parse_list_column(x, separator='|'))
+
+        if cache_path:
+            try:
+                os.makedirs(self.prepared_dir, exist_ok=True)
+                tmp_path = cache_path + ".tmp"
+                df[derived].to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, cache_path)
+                logger.info(f"💾 Cleaned corpus cached to {cache_path}")
+            except Exception as e:  # e.g. pyarrow not installed
+                logger.warning(f"Could not cache cleaned corpus: {e}")
         return df
 
-    def train_category_classifier(self, df: pd.DataFrame):
+    def train_category_classifier(self, df: pd.DataFrame, mode: str = "full"):
         """
         Trains (or Retrains) the SetFit model and SAVES it to disk.
+        mode: "full" fine-tunes body + head (slow on CPU),
+              "head" keeps the body and only refits the one-vs-rest head on cached embeddings (seconds).
         """
+        if mode == "head":
+            return self.train_category_head(df)
+        if mode != "full":
+            raise ValueError(f"Unknown training mode '{mode}' (use 'full' or 'head').")
         logger.info("Training Case Category Classifier (SetFit)...")
         
         # 1. Encode Labels (and SAVE the encoder!)
@@ -97,7 +203,7 @@ class ClimateLitigationAgent:
         })
         
         # 3. Train
-        model = SetFitModel.from_pretrained("sentence-transformers/paraphrase-mpnet-base-v2", multi_target_strategy="one-vs-rest")
+        model = SetFitModel.from_pretrained(SETFIT_BASE_MODEL, multi_target_strategy="one-vs-rest")
         
         trainer = SetFitTrainer(
             model=model,
@@ -116,6 +222,95 @@ class ClimateLitigationAgent:
         model.save_pretrained(self.classifier_path)
         logger.info(f"Category Model saved to {self.classifier_path}")
 
+        # A quantized copy of the old body and embeddings made by it no longer match the new body
+        stale_body = self._quantized_paths()["body"]
+        if os.path.exists(stale_body):
+            os.remove(stale_body)
+            logger.info("Removed the outdated quantized classifier. Run export_quantized() again.")
+        for path in self._head_cache_paths().values():
+            if os.path.exists(path): os.remove(path)
+
+    # --- HEAD-ONLY TRAINING ---
+    def _head_cache_paths(self) -> Dict[str, str]:
+        cache_dir = os.path.join(self.model_dir, "head_cache")
+        return {
+            "embeddings": os.path.join(cache_dir, "embeddings.npy"),
+            "keys": os.path.join(cache_dir, "keys.json"),
+        }
+
+    def _body_embeddings(self, model, texts: List[str], body_id: str) -> np.ndarray:
+        """
+        Body embeddings for texts, cached on disk by text hash. Only texts not seen before
+        (e.g. rows appended since the last run) are encoded.
+        """
+        paths = self._head_cache_paths()
+        cached_keys, cached = [], None
+        if os.path.exists(paths["keys"]) and os.path.exists(paths["embeddings"]):
+            with open(paths["keys"], "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("body") == body_id:
+                cached_keys = meta["keys"]
+                cached = np.load(paths["embeddings"])
+
+        keys = [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+        position = {key: i for i, key in enumerate(cached_keys)}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in position and key not in missing:
+                missing[key] = text
+
+        if missing:
+            logger.info(f"Embedding {len(missing)} new descriptions (reusing {len(cached_keys)} cached).")
+            new = model.model_body.encode(list(missing.values()), batch_size=32, convert_to_numpy=True,
+                                          normalize_embeddings=getattr(model, "normalize_embeddings", False))
+            for key in missing:
+                position[key] = len(position)
+            cached_keys = cached_keys + list(missing)
+            cached = new if cached is None else np.vstack([cached, new])
+
+            os.makedirs(os.path.dirname(paths["embeddings"]), exist_ok=True)
+            with open(paths["embeddings"] + ".tmp", "wb") as f:
+                np.save(f, cached)
+            os.replace(paths["embeddings"] + ".tmp", paths["embeddings"])
+            with open(paths["keys"] + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"body": body_id, "keys": cached_keys}, f)
+            os.replace(paths["keys"] + ".tmp", paths["keys"])
+
+        return cached[[position[key] for key in keys]]
+
+    def train_category_head(self, df: pd.DataFrame):
+        """
+        Fast retraining: keeps the (fine-tuned or base) SetFit body and refits only the one-vs-rest head
+        on cached body embeddings. New labels are picked up, since the binarizer and head are refit on all rows.
+        """
+        start = time.perf_counter()
+        logger.info("Training Case Category head only (cached embeddings)...")
+
+        self.category_binarizer = MultiLabelBinarizer()
+        y_matrix = self.category_binarizer.fit_transform(df['parsed_categories'])
+        os.makedirs(self.model_dir, exist_ok=True)
+        joblib.dump(self.category_binarizer, self.encoder_path)
+
+        # Always embed with the full-precision body, even if the agent serves the int8 one
+        if os.path.exists(self.classifier_path):
+            model = SetFitModel.from_pretrained(self.classifier_path)
+            body_id = "finetuned"
+        else:
+            model = SetFitModel.from_pretrained(SETFIT_BASE_MODEL, multi_target_strategy="one-vs-rest")
+            body_id = SETFIT_BASE_MODEL
+
+        embeddings = self._body_embeddings(model, df['clean_description'].tolist(), body_id)
+        model.model_head.fit(embeddings, y_matrix)
+
+        if body_id == "finetuned":
+            # The body on disk is unchanged, so only the head is rewritten
+            joblib.dump(model.model_head, os.path.join(self.classifier_path, SETFIT_HEAD_FILE))
+        else:
+            model.save_pretrained(self.classifier_path)
+        self.category_model = model
+        self._load_quantized()
+        logger.info(f"Category head trained on {len(df)} rows in {time.perf_counter() - start:.1f}s")
+
     def load_resources(self):
         """
         Loads the trained model and encoder from disk.
@@ -128,50 +323,403 @@ class ClimateLitigationAgent:
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             self.category_model = None
+        self._load_quantized()
+
+    # --- QUANTIZED CPU INFERENCE ---
+    def _quantized_paths(self) -> Dict[str, str]:
+        quantized_dir = os.path.join(self.model_dir, "quantized")
+        return {
+            "dir": quantized_dir,
+            "body": os.path.join(quantized_dir, "category_body.pt"),
+            "encoder": os.path.join(quantized_dir, "law_encoder.pt"),
+            "manifest": os.path.join(quantized_dir, "manifest.json"),
+            "rejected": os.path.join(quantized_dir, "rejected.json"),
+        }
+
+    @staticmethod
+    def _quantize(model):
+        """int8 dynamic quantization: Linear weights stored as int8, activations quantized on the fly (CPU only)."""
+        return torch.quantization.quantize_dynamic(copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+    @staticmethod
+    def _is_int8(model) -> bool:
+        """True for a model produced by _quantize()."""
+        return any(isinstance(m, torch.nn.quantized.dynamic.Linear) for m in model.modules())
+
+    def _index_encoder(self):
+        """
+        fp32 law encoder. The law embeddings on disk and the export baseline always come from it;
+        only queries go through the int8 encoder.
+        """
+        if not self._is_int8(self.embedding_model):
+            return self.embedding_model
+        if self._fp32_encoder is None:
+            logger.info("Loading the full-precision law encoder...")
+            self._fp32_encoder = SentenceTransformer(self.embedding_model_name)
+        return self._fp32_encoder
+
+    def _model_version(self) -> str:
+        """Identifies the fp32 models an export is checked against; changes when the classifier is retrained."""
+        parts = [self.embedding_model_name]
+        if os.path.isdir(self.classifier_path):
+            for name in sorted(os.listdir(self.classifier_path)):
+                st = os.stat(os.path.join(self.classifier_path, name))
+                parts.append(f"{name}:{st.st_size}:{st.st_mtime_ns}")
+        return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def export_rejected(self) -> bool:
+        """True if export_quantized() already rejected the int8 models for the current fp32 models."""
+        path = self._quantized_paths()["rejected"]
+        if not os.path.exists(path): return False
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("model_version") == self._model_version()
+
+    def _load_quantized(self):
+        """
+        Swaps in the int8 SetFit body and law encoder if export_quantized() has produced them.
+        The files are full pickles (torch.load with weights_only=False), so the model directory must be trusted:
+        only load exports made by this pipeline, never ones downloaded or copied in from elsewhere.
+        """
+        paths = self._quantized_paths()
+        if not self.use_quantized or not os.path.exists(paths["manifest"]): return
+        with open(paths["manifest"], "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        try:
+            if self.category_model is not None and os.path.exists(paths["body"]):
+                self.category_model.model_body = torch.load(paths["body"], weights_only=False)
+                logger.info("⚡ Using the int8 classifier body.")
+            if manifest.get("embedding_model_name") == self.embedding_model_name and os.path.exists(paths["encoder"]):
+                self.embedding_model = torch.load(paths["encoder"], weights_only=False)
+                logger.info("⚡ Using the int8 law encoder.")
+        except Exception as e:
+            logger.error(f"Failed to load quantized models, keeping full precision: {e}")
+
+    def export_quantized(self, sample_texts: List[str], max_category_disagreement: float = 0.05,
+                         min_law_overlap: float = 0.9, top_k_laws: int = 3) -> Dict[str, float]:
+        """
+        Builds int8 versions of the SetFit body and the law encoder and saves them only if, on sample_texts:
+        - at most max_category_disagreement of the texts get a different category set, and
+        - the top-k suggested laws overlap with the full-precision ones by at least min_law_overlap (on average).
+        Returns the comparison report (including ms/text before and after).
+        The baseline is always the fp32 models, also on an agent that already serves the int8 ones.
+        """
+        if self.category_model is None:
+            raise ValueError("Train or load the category classifier before exporting.")
+        texts = self.clean_texts(sample_texts)
+        report = {"samples": len(texts)}
+
+        def timed(fn):
+            start = time.perf_counter()
+            out = fn()
+            return out, 1000 * (time.perf_counter() - start) / len(texts)
+
+        # 1. Categories: same head, full vs int8 body (the fp32 body is reloaded from disk if int8 is being served)
+        original_body = self.category_model.model_body
+        full_body = SetFitModel.from_pretrained(self.classifier_path).model_body if self._is_int8(original_body) else original_body
+        quantized_body = self._quantize(full_body)
+        try:
+            self.category_model.model_body = full_body
+            original_preds, report["category_ms"] = timed(lambda: self.category_model.predict(texts).cpu().numpy())
+            self.category_model.model_body = quantized_body
+            quantized_preds, report["category_ms_int8"] = timed(lambda: self.category_model.predict(texts).cpu().numpy())
+        finally:
+            self.category_model.model_body = original_body
+        report["category_disagreement"] = float(np.mean(np.any(original_preds != quantized_preds, axis=1)))
+
+        # 2. Laws: same index, full vs int8 query encoder
+        full_encoder = self._index_encoder()
+        quantized_encoder = self._quantize(full_encoder)
+        encode = lambda model: model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        original_emb, report["encoder_ms"] = timed(lambda: encode(full_encoder))
+        quantized_emb, report["encoder_ms_int8"] = timed(lambda: encode(quantized_encoder))
+        report["embedding_cosine"] = float(np.mean(np.sum(original_emb * quantized_emb, axis=1)))
+        if self.law_embeddings is not None:
+            overlaps = [
+                len({i for i, _ in a} & {i for i, _ in b}) / max(1, len(a))
+                for a, b in zip(self._search_laws(original_emb, top_k_laws), self._search_laws(quantized_emb, top_k_laws))
+            ]
+            report["law_overlap"] = float(np.mean(overlaps))
+
+        logger.info(f"Quantization report: {json.dumps(report)}")
+        if report["category_disagreement"] > max_category_disagreement or report.get("law_overlap", 1.0) < min_law_overlap:
+            logger.error("❌ int8 models are outside the tolerance. Nothing was saved.")
+            report["saved"] = False
+            # Remembered until the fp32 models change, so a start-up export is not retried on every run
+            paths = self._quantized_paths()
+            os.makedirs(paths["dir"], exist_ok=True)
+            with open(paths["rejected"], "w", encoding="utf-8") as f:
+                json.dump(dict(report, model_version=self._model_version()), f, indent=2)
+            return report
+
+        paths = self._quantized_paths()
+        os.makedirs(paths["dir"], exist_ok=True)
+        if os.path.exists(paths["rejected"]):
+            os.remove(paths["rejected"])
+        torch.save(quantized_body, paths["body"])
+        torch.save(quantized_encoder, paths["encoder"])
+        with open(paths["manifest"], "w", encoding="utf-8") as f:
+            json.dump(dict(report, embedding_model_name=self.embedding_model_name), f, indent=2)
+        logger.info(f"💾 int8 models saved to {paths['dir']}")
+        report["saved"] = True
+        self._load_quantized()
+        return report
+
+    # --- LAW INDEX (persisted) ---
+    def _law_index_paths(self) -> Dict[str, str]:
+        return {
+            "embeddings": os.path.join(self.law_index_dir, "law_embeddings.npy"),
+            "laws": os.path.join(self.law_index_dir, "laws.json"),
+            "manifest": os.path.join(self.law_index_dir, "manifest.json"),
+        }
+
+    @staticmethod
+    def _laws_hash(laws: List[str]) -> str:
+        return hashlib.sha256("\n".join(sorted(laws)).encode("utf-8")).hexdigest()
+
+    def _read_law_manifest(self) -> Dict:
+        path = self._law_index_paths()["manifest"]
+        if not os.path.exists(path): return {}
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != LAW_INDEX_VERSION or manifest.get("model_name") != self.embedding_model_name:
+            logger.info("Law index on disk was built with another model/version. It will be rebuilt.")
+            return {}
+        return manifest
+
+    def _read_law_files(self, manifest: Dict) -> Optional[Tuple[List[str], np.ndarray]]:
+        """Laws and memory-mapped embeddings, or None when they do not match the manifest (e.g. an interrupted save)."""
+        paths = self._law_index_paths()
+        try:
+            with open(paths["laws"], "r", encoding="utf-8") as f:
+                laws = json.load(f)
+            embeddings = np.load(paths["embeddings"], mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Law index files are unreadable ({e}). It will be rebuilt.")
+            return None
+        if not (len(laws) == embeddings.shape[0] == manifest.get("count")) or self._laws_hash(laws) != manifest.get("source_hash"):
+            logger.warning("Law index files do not match their manifest. It will be rebuilt.")
+            return None
+        return laws, embeddings
+
+    def load_law_index(self) -> bool:
+        """Memory-maps the persisted law embeddings (rows are L2-normalized, so a dot product is the cosine)."""
+        manifest = self._read_law_manifest()
+        if not manifest: return False
+        files = self._read_law_files(manifest)
+        if files is None: return False
+        self.law_list, self.law_embeddings = files
+        logger.info(f"✅ Law index loaded ({len(self.law_list)} laws, memory-mapped).")
+        self.law_ann = self._load_law_ann() if self.law_index_mode != "exact" else None
+        return True
+
+    def _load_law_ann(self):
+        """Reads the persisted FAISS index for law_index_mode, (re)building it when the law set has changed."""
+        source_hash = self._read_law_manifest()["source_hash"]
+        index_path = os.path.join(self.law_index_dir, f"laws_{self.law_index_mode}.faiss")
+        hash_path = index_path + ".hash"
+        if os.path.exists(index_path) and os.path.exists(hash_path):
+            with open(hash_path, "r") as f:
+                if f.read().strip() == source_hash:
+                    index = faiss.read_index(index_path)
+                    self._tune_law_ann(index)
+                    return index
+
+        start = time.perf_counter()
+        vectors = np.ascontiguousarray(self.law_embeddings, dtype=np.float32)
+        n, dim = vectors.shape
+        if self.law_index_mode == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        elif self.law_index_mode == "ivf":
+            # ~4*sqrt(n) lists, but keep ~39 training points per list as FAISS recommends
+            nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+            index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+        else:
+            raise ValueError(f"Unknown law_index_mode '{self.law_index_mode}' (use 'exact', 'hnsw' or 'ivf').")
+        index.add(vectors)
+        faiss.write_index(index, index_path)
+        with open(hash_path, "w") as f:
+            f.write(source_hash)
+        logger.info(f"Built {self.law_index_mode.upper()} law index over {n} laws in {time.perf_counter() - start:.1f}s")
+        self._tune_law_ann(index)
+        return index
+
+    @staticmethod
+    def _tune_law_ann(index):
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        if hasattr(index, "nprobe"):
+            index.nprobe = IVF_NPROBE
+
+    def _save_law_index(self, laws: List[str], embeddings: np.ndarray):
+        paths = self._law_index_paths()
+        os.makedirs(self.law_index_dir, exist_ok=True)
+        # Drop the old manifest first and write the new one last, so a crash never leaves a manifest next to
+        # data files it does not describe (no manifest = no index, and the next build starts over)
+        if os.path.exists(paths["manifest"]):
+            os.remove(paths["manifest"])
+        with open(paths["embeddings"] + ".tmp", "wb") as f:
+            np.save(f, embeddings)
+        os.replace(paths["embeddings"] + ".tmp", paths["embeddings"])
+        with open(paths["laws"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(laws, f, ensure_ascii=False)
+        os.replace(paths["laws"] + ".tmp", paths["laws"])
+        manifest = {
+            "version": LAW_INDEX_VERSION,
+            "model_name": self.embedding_model_name,
+            "source_hash": self._laws_hash(laws),
+            "count": len(laws),
+            "dim": int(embeddings.shape[1]) if len(laws) else 0,
+        }
+        with open(paths["manifest"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(paths["manifest"] + ".tmp", paths["manifest"])
 
     def build_law_retrieval_index(self, df: pd.DataFrame):
+        """
+        Brings the persisted law index in line with the laws in df.
+        Only laws that are not on disk yet get embedded; laws no longer in the data are dropped.
+        """
         logger.info("Building Law Retrieval Index...")
         all_laws = set()
         for law_list in df['parsed_laws']:
             for law in law_list:
                 all_laws.add(law)
-        self.law_list = list(all_laws)
-        if self.law_list:
-            self.law_embeddings = self.embedding_model.encode(self.law_list, convert_to_tensor=True)
-        else:
+        if not all_laws:
             logger.warning("No laws found to index.")
+            return
+
+        manifest = self._read_law_manifest()
+        if manifest.get("source_hash") == self._laws_hash(list(all_laws)) and self.load_law_index():
+            logger.info("Law index is up to date.")
+            return
+
+        old_laws, old_embeddings = [], None
+        files = self._read_law_files(manifest) if manifest else None
+        if files is not None:
+            old_laws, old_embeddings = files
+
+        keep = [i for i, law in enumerate(old_laws) if law in all_laws]
+        new_laws = sorted(all_laws - set(old_laws))
+        logger.info(f"Embedding {len(new_laws)} new laws (reusing {len(keep)}, dropping {len(old_laws) - len(keep)}).")
+
+        parts = []
+        if keep:
+            parts.append(np.asarray(old_embeddings[keep], dtype=np.float32))
+        if new_laws:
+            # Always fp32: the manifest names the full-precision model, and int8 rows would drift from the reused ones
+            parts.append(self._index_encoder().encode(new_laws, batch_size=64, normalize_embeddings=True,
+                                                      convert_to_numpy=True).astype(np.float32))
+        laws = [old_laws[i] for i in keep] + new_laws
+        # Release the memory maps before replacing the files (Windows cannot replace a mapped file)
+        old_embeddings, self.law_embeddings, self.law_ann = None, None, None
+        self._save_law_index(laws, np.vstack(parts))
+        self.load_law_index()
+
+    def _search_laws(self, query_embeddings: np.ndarray, top_k: int, exact: bool = False) -> List[List[Tuple[int, float]]]:
+        """Top-k (law index, cosine) per normalized query row, best first. Uses the ANN index unless exact=True."""
+        if self.law_ann is not None and not exact:
+            scores, ids = self.law_ann.search(np.ascontiguousarray(query_embeddings, dtype=np.float32), top_k)
+            return [
+                [(int(i), float(score)) for i, score in zip(row_ids, row_scores) if i >= 0]
+                for row_ids, row_scores in zip(ids, scores)
+            ]
+        scores = query_embeddings @ self.law_embeddings.T
+        top_k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ranked = candidates[np.argsort(-row[candidates])]
+            results.append([(int(i), float(row[i])) for i in ranked])
+        return results
+
+    def law_index_report(self, descriptions: List[str], top_k: int = 3, threshold: float = 0.25) -> Dict[str, float]:
+        """
+        Recall vs latency of the ANN law index against the exact search, on the given descriptions.
+        recall@k: share of the exact top-k laws the ANN also returns.
+        threshold_recall: same, counting only laws above the predict() threshold.
+        """
+        if self.law_embeddings is None:
+            raise ValueError("Build the law index first.")
+        queries = self.embedding_model.encode(self.clean_texts(descriptions), normalize_embeddings=True, convert_to_numpy=True)
+
+        def timed(exact):
+            start = time.perf_counter()
+            hits = [self._search_laws(q[None, :], top_k, exact=exact)[0] for q in queries]
+            return hits, 1000 * (time.perf_counter() - start) / len(queries)
+
+        exact_hits, exact_ms = timed(True)
+        ann_hits, ann_ms = timed(False)
+
+        recall, threshold_recall = [], []
+        for exact, ann in zip(exact_hits, ann_hits):
+            ann_ids = {i for i, _ in ann}
+            recall.append(len({i for i, _ in exact} & ann_ids) / max(1, len(exact)))
+            above = {i for i, score in exact if score > threshold}
+            if above:
+                threshold_recall.append(len(above & ann_ids) / len(above))
+
+        report = {
+            "mode": self.law_index_mode,
+            "laws": len(self.law_list),
+            "queries": len(queries),
+            f"recall@{top_k}": round(float(np.mean(recall)), 4),
+            "threshold_recall": round(float(np.mean(threshold_recall)), 4) if threshold_recall else None,
+            "exact_ms_per_query": round(exact_ms, 3),
+            "ann_ms_per_query": round(ann_ms, 3),
+        }
+        logger.info(f"Law index report: {json.dumps(report)}")
+        return report
 
     def predict(self, description: str, top_k_laws: int = 3) -> Dict[str, Union[List[str], float]]:
-        if not description: return {"error": "Empty description"}
-        clean_desc = self.clean_text(description)
-        
-        results = {"original_text": description, "predicted_categories": [], "suggested_laws": []}
+        return self.predict_batch([description], top_k_laws=top_k_laws)[0]
+
+    def predict_batch(self, descriptions: List[str], top_k_laws: int = 3, batch_size: int = 64) -> List[Dict[str, Union[List[str], float]]]:
+        """
+        Vectorized predict(): one spaCy pass, batched classification and embedding,
+        and a single matrix top-k search for the laws. Results are in input order.
+        """
+        start = time.perf_counter()
+        results = [
+            {"original_text": d, "predicted_categories": [], "suggested_laws": []} if d else {"error": "Empty description"}
+            for d in descriptions
+        ]
+        todo = [i for i, d in enumerate(descriptions) if d]
+        if not todo:
+            return results
+        clean_descs = self.clean_texts([descriptions[i] for i in todo], batch_size=max(batch_size, 256))
 
         # 1. Predict Categories
         if self.category_model and self.category_binarizer:
-            preds = self.category_model.predict([clean_desc])
-            try:
-                # Decode binary vector back to strings
-                predicted_labels = self.category_binarizer.inverse_transform(preds.cpu().numpy())
-                results["predicted_categories"] = [label for label in predicted_labels[0]]
-            except Exception as e:
-                logger.error(f"Error decoding categories: {e}")
+            for offset in range(0, len(todo), batch_size):
+                preds = self.category_model.predict(clean_descs[offset:offset + batch_size])
+                try:
+                    # Decode binary vectors back to strings
+                    predicted_labels = self.category_binarizer.inverse_transform(preds.cpu().numpy())
+                    for i, labels in zip(todo[offset:offset + batch_size], predicted_labels):
+                        results[i]["predicted_categories"] = list(labels)
+                except Exception as e:
+                    logger.error(f"Error decoding categories: {e}")
         else:
-            results["predicted_categories"] = ["Model not loaded/trained"]
+            for i in todo:
+                results[i]["predicted_categories"] = ["Model not loaded/trained"]
 
         # 2. Predict Laws
         if self.law_embeddings is not None:
-            query_embedding = self.embedding_model.encode(clean_desc, convert_to_tensor=True)
-            hits = util.semantic_search(query_embedding, self.law_embeddings, top_k=top_k_laws)
-            for hit in hits[0]:
-                if hit['score'] > 0.25:
-                    results["suggested_laws"].append({
-                        "law": self.law_list[hit['corpus_id']],
-                        "confidence": round(hit['score'], 3)
-                    })
+            query_embeddings = self.embedding_model.encode(clean_descs, batch_size=batch_size,
+                                                           normalize_embeddings=True, convert_to_numpy=True)
+            for i, hits in zip(todo, self._search_laws(query_embeddings, top_k_laws)):
+                results[i]["suggested_laws"] = [
+                    {"law": self.law_list[law_id], "confidence": round(score, 3)}
+                    for law_id, score in hits if score > 0.25
+                ]
         else:
-            results["suggested_laws"] = ["Index not built"]
+            for i in todo:
+                results[i]["suggested_laws"] = ["Index not built"]
 
+        if len(descriptions) > 1:
+            elapsed = time.perf_counter() - start
+            logger.info(f"Predicted {len(descriptions)} cases in {elapsed:.2f}s ({1000 * elapsed / len(descriptions):.1f} ms/case)")
         return results
 
 # ==========================================
@@ -210,18 +758,29 @@ if __name__ == "__main__":
     df_processed = agent.load_and_prepare_data(dummy_csv_name)
 
     # 3. Train OR Load
+    # Set to True after a data refresh: keeps the fine-tuned body and only refits the head (seconds instead of minutes)
+    RETRAIN_HEAD_ONLY = False
+
     if not model_exists:
         print("\n🚀 No saved model found. Training new model...")
         agent.train_category_classifier(df_processed)
+    elif RETRAIN_HEAD_ONLY:
+        print("\n⚡ Refitting the classification head on cached embeddings...")
+        agent.train_category_classifier(df_processed, mode="head")
     else:
         print("\n💾 Saved model found. Loading from disk (Skipping training)...")
         # Note: agent.__init__ already tried to load it, but we can ensure it's loaded
         if agent.category_model is None:
             agent.load_resources()
 
-    # 4. Always rebuild Law Index (Fast, usually done on startup in memory)
-    # In a real app, you would also save/load the law embeddings via pickle/joblib
+    # 4. Sync the Law Index (only laws new since the last run get embedded; the rest is memory-mapped from disk)
     agent.build_law_retrieval_index(df_processed)
+
+    # 4b. One-off int8 export for faster CPU inference (checked against the full-precision models).
+    #     Skipped while a rejected export is on record for the current models (retrain, or delete quantized/rejected.json)
+    if not os.path.exists(agent._quantized_paths()["body"]) and not agent.export_rejected():
+        descriptions = df_processed['Description'].dropna()
+        agent.export_quantized(descriptions.sample(n=min(200, len(descriptions)), random_state=0).tolist())
     
     # 5. Test
     # test_text = "A local group in California is suing the city for approving a new highway that will increase emissions."
@@ -232,6 +791,28 @@ if __name__ == "__main__":
     print("Categories:", prediction["predicted_categories"])
     print("Laws:", prediction["suggested_laws"])
 
+    # 6. Batch prediction (e.g. a backlog of new cases)
+    backlog = df_processed['Description'].dropna().tolist()[:256]
+    start = time.perf_counter()
+    for text in backlog[:32]:
+        agent.predict(text)
+    single_ms = 1000 * (time.perf_counter() - start) / max(1, len(backlog[:32]))
+    start = time.perf_counter()
+    predictions = agent.predict_batch(backlog)
+    batch_ms = 1000 * (time.perf_counter() - start) / max(1, len(backlog))
+    print(f"\n--- BATCH PREDICTION ---")
+    print(f"predict: {single_ms:.1f} ms/case | predict_batch ({len(backlog)}): {batch_ms:.1f} ms/case")
+
+    # 7. ANN law index: recall vs latency against the exact search (needs faiss-cpu)
+    if faiss is not None:
+        print(f"\n--- LAW INDEX: EXACT vs ANN ---")
+        for mode in ("hnsw", "ivf"):
+            agent.law_index_mode = mode
+            agent.load_law_index()
+            print(agent.law_index_report(backlog[:100]))
+        agent.law_index_mode = "exact"
+        agent.load_law_index()
+
     # if os.path.exists(dummy_csv_name): os.remove(dummy_csv_name)
 
     ##########################################
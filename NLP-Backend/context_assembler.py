@@ -0,0 +1,131 @@
+### Fits the vector + graph context of a question into a token budget before synthesis.
+import re
+import logging
+from typing import List, Dict, Any, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Google documents ~4 characters per token for Gemini models
+CHARS_PER_TOKEN = 4
+
+
+def make_token_counter(model_name: str = "") -> Callable[[str], int]:
+    """
+    Returns a fast local token counter for the chosen model.
+    - Gemini: character estimate (no network round-trip per item)
+    - Others (Llama3 via Ollama): tiktoken cl100k_base if installed (close to Llama3's BPE), else the estimate
+    """
+    def estimate(text: str) -> int:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+    if "gemini" in (model_name or "").lower():
+        return estimate
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(enc.encode(text)) if text else 0
+    except ImportError:
+        return estimate
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\W+", " ", text or "").strip().lower()
+
+
+class ContextAssembler:
+    """
+    Allocates a token budget between the vector and graph legs.
+
+    Items are dicts: {"text": str, "score": float, "doc": optional document name, "truncatable": bool}
+    - Exact duplicate facts (across both legs) are kept once.
+    - Graph facts about a document that the vector leg already contains are demoted,
+      so they are the first to go when the budget is tight.
+    - Within a leg the lowest-score items are dropped first; a truncatable item that
+      does not fit is cut down to the remaining budget instead of being dropped.
+    - Budget one leg does not need is handed to the other.
+    """
+
+    def __init__(self, token_budget: int = 3000, vector_share: float = 0.6,
+                 token_counter: Callable[[str], int] = None, min_truncated_tokens: int = 40):
+        self.token_budget = token_budget
+        self.vector_share = vector_share
+        self.count_tokens = token_counter or make_token_counter()
+        self.min_truncated_tokens = min_truncated_tokens
+
+    def _dedupe(self, vector_items, graph_items):
+        seen = set()
+        unique_vector = []
+        for item in vector_items:
+            key = _normalize(item["text"])
+            if key in seen: continue
+            seen.add(key)
+            unique_vector.append(item)
+
+        vector_docs = {_normalize(item.get("doc")) for item in unique_vector if item.get("doc")}
+        unique_graph = []
+        for item in graph_items:
+            key = _normalize(item["text"])
+            if key in seen: continue
+            seen.add(key)
+            if item.get("doc") and _normalize(item["doc"]) in vector_docs:
+                item = dict(item, score=item["score"] * 0.5)
+            unique_graph.append(item)
+        return unique_vector, unique_graph
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        # Shrink by character ratio until it fits (usually one or two passes)
+        while text and self.count_tokens(text) > max_tokens:
+            ratio = max_tokens / self.count_tokens(text)
+            text = text[:max(0, int(len(text) * ratio) - 3)]
+        return text.rstrip() + "..."
+
+    def _fit(self, items, budget):
+        """Returns (kept items best-first, dropped count, truncated count, tokens used)."""
+        costs = [self.count_tokens(item["text"]) for item in items]
+        ranked = sorted(range(len(items)), key=lambda i: items[i]["score"], reverse=True)
+        kept, used, truncated = {}, 0, 0
+        for i in ranked:
+            if used + costs[i] <= budget:
+                kept[i] = items[i]
+                used += costs[i]
+            elif items[i].get("truncatable") and budget - used >= self.min_truncated_tokens:
+                text = self._truncate(items[i]["text"], budget - used - 1)
+                kept[i] = dict(items[i], text=text)
+                used += self.count_tokens(text)
+                truncated += 1
+        ordered = [kept[i] for i in ranked if i in kept]
+        return ordered, len(items) - len(kept), truncated, used
+
+    def assemble(self, vector_items: List[Dict[str, Any]], graph_items: List[Dict[str, Any]]) -> Tuple[List[Dict], List[Dict], Dict[str, int]]:
+        """
+        Returns (vector items, graph items, stats) that fit the budget.
+        stats: tokens_before, tokens_after, tokens_saved, dropped, truncated, duplicates
+        """
+        tokens_before = sum(self.count_tokens(i["text"]) for i in vector_items + graph_items)
+        vector_unique, graph_unique = self._dedupe(vector_items, graph_items)
+        duplicates = len(vector_items) + len(graph_items) - len(vector_unique) - len(graph_unique)
+
+        # Split the budget, then give what one leg does not need to the other
+        vector_budget = int(self.token_budget * self.vector_share)
+        graph_budget = self.token_budget - vector_budget
+        vector_need = sum(self.count_tokens(i["text"]) for i in vector_unique)
+        graph_need = sum(self.count_tokens(i["text"]) for i in graph_unique)
+        if vector_need < vector_budget:
+            graph_budget += vector_budget - vector_need
+            vector_budget = vector_need
+        elif graph_need < graph_budget:
+            vector_budget += graph_budget - graph_need
+            graph_budget = graph_need
+
+        vector_kept, v_dropped, v_truncated, v_used = self._fit(vector_unique, vector_budget)
+        graph_kept, g_dropped, g_truncated, g_used = self._fit(graph_unique, graph_budget)
+
+        stats = {
+            "tokens_before": tokens_before,
+            "tokens_after": v_used + g_used,
+            "tokens_saved": tokens_before - (v_used + g_used),
+            "dropped": v_dropped + g_dropped,
+            "truncated": v_truncated + g_truncated,
+            "duplicates": duplicates,
+        }
+        return vector_kept, graph_kept, stats
@@ -1,73 +1,318 @@
 import pandas as pd
+import numpy as np
+import hashlib
+import gzip
 import json
+import os
+import re
+from context_assembler import make_token_counter, CHARS_PER_TOKEN
 
-def convert_csv_to_gemini_jsonl(input_csv, train_jsonl, eval_jsonl, eval_count=100):
+try:
+    import zstandard  # Optional: only needed for compression="zstd"
+except ImportError:
+    zstandard = None
+
+try:
+    from datasketch import MinHash, MinHashLSH  # Optional: only needed for dedup_threshold
+except ImportError:
+    MinHash = MinHashLSH = None
+
+# One template per tuning task: the CSV column the model has to produce, and the instruction before the description
+TASKS = {
+    "laws": {
+        "column": "Principal Laws",
+        "prompt": "Analyze the following legal case description and assign the appropriate "
+                  "principal laws that might be violated.\n\nDescription:\n",
+    },
+    "categories": {
+        "column": "Case Categories",
+        "prompt": "Analyze the following legal case description and assign the appropriate "
+                  "case categories.\n\nDescription:\n",
+    },
+    "status": {
+        "column": "Status",
+        "prompt": "Analyze the following legal case description and predict the current "
+                  "status of the case.\n\nDescription:\n",
+    },
+}
+
+# Stratify the split on the top-level category ("Suits Against Governments>Clean Air Claims|..." -> "Suits Against Governments")
+STRATIFY_COLUMN = "Case Categories"
+RECORD_PREFIX = '{"contents": [{"role": "user", "parts": [{"text": '
+RECORD_MIDDLE = '}]}, {"role": "model", "parts": [{"text": '
+RECORD_SUFFIX = '}]}]}\n'
+
+# Near-duplicate detection: word 5-gram shingles, 128 permutations (~0.09 standard error on Jaccard)
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+
+
+class ShardWriter:
+    """Writes JSONL lines to <prefix>-00000.jsonl.gz, -00001, ... starting a new shard after shard_bytes (uncompressed)."""
+
+    def __init__(self, prefix, compression="gzip", shard_bytes=100 * 1024 * 1024):
+        self.prefix = prefix
+        self.compression = compression
+        self.shard_bytes = shard_bytes
+        self.files = []
+        self.records = 0
+        self._f = None
+        self._written = 0
+
+    def _open(self):
+        suffix = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst", None: ".jsonl"}[self.compression]
+        path = f"{self.prefix}-{len(self.files):05d}{suffix}"
+        if self.compression == "gzip":
+            f = gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+        elif self.compression == "zstd":
+            f = zstandard.open(path, "wt", encoding="utf-8")
+        else:
+            f = open(path, "w", encoding="utf-8")
+        self.files.append(path)
+        self._f, self._written = f, 0
+
+    def write(self, lines):
+        for line in lines:
+            if self._f is None or (self.shard_bytes and self._written >= self.shard_bytes):
+                self.close()
+                self._open()
+            self._f.write(line)
+            self._written += len(line)
+            self.records += 1
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class NearDuplicateFilter:
+    """
+    MinHash LSH over word shingles of the descriptions. Keeps the first description of every group whose
+    estimated Jaccard similarity is above the threshold; runs before the split, so no near-duplicate
+    can end up in train and eval at the same time. Memory is one signature per kept description.
+    """
+
+    def __init__(self, threshold=0.85, num_perm=NUM_PERM):
+        self.lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+        self.num_perm = num_perm
+        self.seen = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _shingles(text):
+        words = re.sub(r"\W+", " ", text).lower().split()
+        if len(words) <= SHINGLE_WORDS:
+            return [" ".join(words).encode("utf-8")]
+        return [" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8") for i in range(len(words) - SHINGLE_WORDS + 1)]
+
+    def keep(self, descriptions):
+        """Boolean mask: True for descriptions not similar to anything kept before (in this or an earlier chunk)."""
+        signatures = MinHash.bulk([self._shingles(t) for t in descriptions], num_perm=self.num_perm)
+        keep = np.ones(len(signatures), dtype=bool)
+        for i, signature in enumerate(signatures):
+            if self.lsh.query(signature):
+                keep[i] = False
+                self.dropped += 1
+            else:
+                self.lsh.insert(str(self.seen), signature)
+            self.seen += 1
+        return keep
+
+
+def _apply_token_budget(description, description_tokens, fixed_tokens, max_tokens, overflow):
+    """
+    Enforces max_tokens per example (prompt + description + answer).
+    overflow="truncate" shortens the description to fit, "drop" removes the example; so does truncate
+    when the prompt and answer alone are over budget. Returns (keep mask, descriptions, example tokens, truncated).
+    """
+    tokens = fixed_tokens + description_tokens
+    over = (tokens > max_tokens).to_numpy()
+    if overflow == "drop" or not over.any():
+        return ~over, description, tokens, 0
+
+    room = (max_tokens - fixed_tokens[over]).to_numpy()
+    fits = room > 0
+    cut = description[over][fits]
+    # Character cut at CHARS_PER_TOKEN per token: exact for the Gemini estimate, close for tiktoken
+    cut = pd.Series([text[:n * CHARS_PER_TOKEN] for text, n in zip(cut, room[fits])], index=cut.index)
+    description = description.copy()
+    description[cut.index] = cut
+    tokens = tokens.copy()
+    tokens[cut.index] = fixed_tokens[cut.index] + np.minimum(description_tokens[cut.index], room[fits])
+    keep = np.ones(len(description), dtype=bool)
+    keep[np.flatnonzero(over)[~fits]] = False
+    return keep, description, tokens, len(cut)
+
+
+def _stable_fraction(values):
+    """Deterministic value in [0, 1) per string (same on every run and machine, unlike hash())."""
+    return np.array([int.from_bytes(hashlib.md5(v.encode("utf-8")).digest()[:8], "big") / 2 ** 64 for v in values])
+
+
+def _split_eval(strata, counters, eval_fraction):
     """
-    Converts a CSV file to Gemini Finetuning JSONL format, splitting into train and eval sets.
+    Systematic sampling per stratum: the n-th row of a stratum goes to eval whenever n * eval_fraction
+    crosses an integer. Every stratum (even a small one) gets its share, the result only depends on
+    the file, and memory is one counter per stratum.
     """
-    
-    # Load the dataset
+    position = strata.groupby(strata).cumcount().to_numpy() + strata.map(lambda s: counters.get(s, 0)).to_numpy()
+    uniques = strata.unique()
+    phase = strata.map(dict(zip(uniques, _stable_fraction(uniques)))).to_numpy()
+    is_eval = np.floor((position + 1) * eval_fraction + phase) > np.floor(position * eval_fraction + phase)
+    for stratum, count in strata.value_counts().items():
+        counters[stratum] = counters.get(stratum, 0) + count
+    return is_eval
+
+
+def convert_csv_to_gemini_shards(input_csv, output_dir, tasks=("laws",), eval_fraction=0.05,
+                                 compression="gzip", shard_bytes=100 * 1024 * 1024, chunksize=5000,
+                                 dedup_threshold=None, max_tokens=None, overflow="truncate", token_model="gemini"):
+    """
+    Converts a CSV file to Gemini Finetuning JSONL shards, one train and one eval set per task, in a single pass.
+    The CSV is read in chunks and the records are built with vectorized string operations,
+    so memory stays flat however large the source is. Writes a manifest.json with the counts and shard paths.
+
+    Preprocessing (tuning cost and time scale with the token count):
+        dedup_threshold: drop descriptions whose MinHash Jaccard estimate with an earlier one is above this (e.g. 0.85).
+        max_tokens: per-example budget; over-long examples are truncated or dropped (overflow="truncate"|"drop").
+    """
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("compression='zstd' needs the zstandard package (pip install zstandard).")
+    if dedup_threshold is not None and MinHashLSH is None:
+        raise ImportError("dedup_threshold needs the datasketch package (pip install datasketch).")
+    if overflow not in ("truncate", "drop"):
+        raise ValueError("overflow must be 'truncate' or 'drop'.")
+    unknown = [t for t in tasks if t not in TASKS]
+    if unknown:
+        raise ValueError(f"Unknown task(s) {unknown}. Choose from {list(TASKS)}.")
+    os.makedirs(output_dir, exist_ok=True)
+
+    columns = {"Description", STRATIFY_COLUMN} | {TASKS[t]["column"] for t in tasks}
     try:
-        df = pd.read_csv(input_csv, on_bad_lines='skip')
+        reader = pd.read_csv(input_csv, on_bad_lines='skip', chunksize=chunksize, dtype=str,
+                             usecols=lambda c: c in columns)
     except FileNotFoundError:
         print(f"Error: The file {input_csv} was not found.")
         return
 
-    # Filter out invalid rows first so our split is accurate on valid data only
-    # We create a copy to avoid SettingWithCopy warnings
-    df_clean = df.dropna(subset=['Description', 'Case Categories']).copy()
-    
-    total_rows = len(df_clean)
-    
-    # Safety check for dataset size
-    if total_rows <= eval_count:
-        print(f"Error: Dataset size ({total_rows}) is too small for an eval set of {eval_count}.")
-        print("Proceeding with converting entire dataset to training file only.")
-        train_df = df_clean
-        eval_df = pd.DataFrame() # Empty
-    else:
-        # Create the split
-        # random_state=42 ensures the split is reproducible
-        eval_df = df_clean.sample(n=eval_count, random_state=42) 
-        train_df = df_clean.drop(eval_df.index)
-
-    print(f"Total valid rows: {total_rows}")
-    print(f"Training set size: {len(train_df)}")
-    print(f"Evaluation set size: {len(eval_df)}")
-
-    # Helper function to write a dataframe to JSONL
-    def write_df_to_jsonl(dataframe, filename):
-        if dataframe.empty:
-            return
-            
-        with open(filename, 'w', encoding='utf-8') as f:
-            for _, row in dataframe.iterrows():
-                description = row['Description']
-                case_laws = row['Principal Laws'] 
-                
-                user_text = (
-                    f"Analyze the following legal case description and assign the appropriate "
-                    f"principal laws that might be violated.\n\nDescription:\n{description}"
-                )
-                model_text = str(case_laws)
-                
-                entry = {
-                    "contents": [
-                        {"role": "user", "parts": [{"text": user_text}]},
-                        {"role": "model", "parts": [{"text": model_text}]}
-                    ]
-                }
-                f.write(json.dumps(entry) + '\n')
-        print(f"Saved {filename}")
-
-    # Write the files
-    write_df_to_jsonl(train_df, train_jsonl)
-    if not eval_df.empty:
-        write_df_to_jsonl(eval_df, eval_jsonl)
-
-# Run the conversion
-convert_csv_to_gemini_jsonl(
-    './Data/CASES_COMBINED_status.csv', 
-    'gemini_finetune_CC_train.jsonl', 
-    'gemini_finetune_CC_eval.jsonl'
-)
\ No newline at end of file
+    writers = {
+        (task, split): ShardWriter(os.path.join(output_dir, f"gemini_finetune_{task}_{split}"), compression, shard_bytes)
+        for task in tasks for split in ("train", "eval")
+    }
+    # The escaped prompt without its closing quote; the escaped description (minus its opening quote) completes it
+    prompts = {task: json.dumps(TASKS[task]["prompt"])[:-1] for task in tasks}
+    counters, strata_counts, skipped, missing = {}, {}, 0, set()
+    count_tokens = make_token_counter(token_model)
+    prompt_tokens = {task: count_tokens(TASKS[task]["prompt"]) for task in tasks}
+    dedup = NearDuplicateFilter(dedup_threshold) if dedup_threshold is not None else None
+    token_stats = {task: {"tokens_before": 0, "saved_by_dedup": 0, "saved_by_budget": 0, "tokens_after": 0,
+                          "dropped_over_budget": 0, "truncated": 0} for task in tasks}
+
+    try:
+        for chunk in reader:
+            # Filter out invalid rows first so our split is accurate on valid data only
+            valid = chunk["Description"].notna() & chunk[STRATIFY_COLUMN].notna()
+            skipped += int((~valid).sum())
+            chunk = chunk[valid]
+            if chunk.empty: continue
+
+            description_tokens = chunk["Description"].map(count_tokens)
+            fixed_tokens = {}
+            for task in tasks:
+                if TASKS[task]["column"] not in chunk:
+                    missing.add(TASKS[task]["column"])
+                    continue
+                target = chunk[TASKS[task]["column"]]
+                fixed_tokens[task] = prompt_tokens[task] + target.fillna("").map(count_tokens)
+                token_stats[task]["tokens_before"] += int((fixed_tokens[task] + description_tokens)[target.notna()].sum())
+
+            # Near-duplicates go before the split, so the split counters only see kept rows
+            if dedup is not None:
+                unique = dedup.keep(chunk["Description"].tolist())
+                for task in fixed_tokens:
+                    duplicate = ~unique & chunk[TASKS[task]["column"]].notna().to_numpy()
+                    token_stats[task]["saved_by_dedup"] += int((fixed_tokens[task] + description_tokens)[duplicate].sum())
+                    fixed_tokens[task] = fixed_tokens[task][unique]
+                chunk, description_tokens = chunk[unique], description_tokens[unique]
+                if chunk.empty: continue
+
+            strata = chunk[STRATIFY_COLUMN].str.split("|").str[0].str.split(">").str[0].str.strip()
+            is_eval = _split_eval(strata, counters, eval_fraction)
+            description = chunk["Description"].map(json.dumps).str[1:]  # escape once, shared by every task
+
+            for task in fixed_tokens:
+                target = chunk[TASKS[task]["column"]]
+                has_target = target.notna().to_numpy()
+                task_description, tokens = description, fixed_tokens[task] + description_tokens
+                if max_tokens is not None:
+                    within, budget_description, tokens, truncated = _apply_token_budget(
+                        chunk["Description"], description_tokens, fixed_tokens[task], max_tokens, overflow)
+                    stats = token_stats[task]
+                    stats["saved_by_budget"] += int((fixed_tokens[task] + description_tokens - tokens)[has_target].sum())
+                    stats["saved_by_budget"] += int(tokens[has_target & ~within].sum())
+                    stats["dropped_over_budget"] += int((has_target & ~within).sum())
+                    stats["truncated"] += truncated
+                    if truncated:
+                        changed = budget_description.index[budget_description.ne(chunk["Description"]).to_numpy()]
+                        task_description = description.copy()
+                        task_description[changed] = budget_description[changed].map(json.dumps).str[1:]
+                    has_target = has_target & within
+                token_stats[task]["tokens_after"] += int(tokens[has_target].sum())
+
+                lines = (RECORD_PREFIX + prompts[task] + task_description + RECORD_MIDDLE
+                         + target.fillna("").map(json.dumps) + RECORD_SUFFIX)
+                writers[(task, "train")].write(lines[has_target & ~is_eval])
+                writers[(task, "eval")].write(lines[has_target & is_eval])
+
+            for stratum, split in zip(strata, np.where(is_eval, "eval", "train")):
+                strata_counts.setdefault(stratum, {"train": 0, "eval": 0})[split] += 1
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    manifest = {
+        "source": input_csv,
+        "eval_fraction": eval_fraction,
+        "compression": compression,
+        "skipped_rows": skipped,
+        "near_duplicates_dropped": dedup.dropped if dedup else 0,
+        "tokens": token_stats,
+        "strata": strata_counts,
+        "tasks": {
+            task: {split: {"records": writers[(task, split)].records, "files": writers[(task, split)].files}
+                   for split in ("train", "eval")}
+            for task in tasks
+        },
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    if missing:
+        print(f"Warning: column(s) {sorted(missing)} not found in {input_csv}; those tasks are empty.")
+    print(f"Total valid rows: {sum(c['train'] + c['eval'] for c in strata_counts.values())} ({skipped} skipped)")
+    for task, splits in manifest["tasks"].items():
+        print(f"[{task}] Training set size: {splits['train']['records']} | Evaluation set size: {splits['eval']['records']}"
+              f" | {len(splits['train']['files']) + len(splits['eval']['files'])} shards")
+    if dedup:
+        print(f"Near-duplicates dropped: {dedup.dropped} of {dedup.seen} descriptions (threshold {dedup_threshold})")
+    for task, stats in token_stats.items():
+        saved = stats["saved_by_dedup"] + stats["saved_by_budget"]
+        print(f"[{task}] Tokens: {stats['tokens_before']:,} -> {stats['tokens_after']:,} (saved {saved:,}: "
+              f"{stats['saved_by_dedup']:,} duplicates, {stats['saved_by_budget']:,} budget; "
+              f"{stats['truncated']} truncated, {stats['dropped_over_budget']} dropped)")
+    print(f"Saved {output_dir}/manifest.json")
+    return manifest
+
+
+if __name__ == "__main__":
+    # Run the conversion
+    convert_csv_to_gemini_shards(
+        './Data/CASES_COMBINED_status.csv',
+        'gemini_finetune_CC',
+        tasks=("laws", "categories", "status"),
+        eval_fraction=0.05,
+        compression="gzip",
+        dedup_threshold=0.85,
+        max_tokens=2048
+    )
@@ -0,0 +1,235 @@
+### Local snapshot of every entity's graph neighbourhood (linked cases + policies) for the retrieval engines.
+### The graph only changes when ingestion runs, so the graph leg can be answered from a memory-mapped
+### SQLite file instead of a Neo4j round-trip per entity.
+### Usage: python graph_snapshot.py build     (full export)
+###        python graph_snapshot.py refresh   (only entities touched since the last build/refresh)
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import argparse
+import threading
+from typing import Dict, Any, Iterable, List, Optional
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Cases/policies kept per entity. The engines show at most 5 (hybrid) or 3 + 3 (policy).
+NEIGHBOURS_PER_ENTITY = 5
+MMAP_BYTES = 256 * 1024 * 1024
+
+# One row per named node. Names shared by several nodes (e.g. a Law and an Organization) are merged later.
+NEIGHBOURHOOD_CYPHER = """
+MATCH (e) WHERE e.name IS NOT NULL {where}
+CALL {{
+    WITH e
+    OPTIONAL MATCH (e)<-[:MENTIONS]-(c:CourtCase)
+    WITH c LIMIT $limit
+    RETURN collect({{case: c.name, year: c.year}}) AS cases
+}}
+CALL {{
+    WITH e
+    OPTIONAL MATCH (e)<-[r]-(p:Policy)
+    WITH p, r LIMIT $limit
+    RETURN collect({{policy: p.title, relation: type(r), date: p.date}}) AS policies
+}}
+RETURN e.name AS name, [l IN labels(e) WHERE l <> 'Entity'] AS labels, cases, policies
+"""
+
+# Entities linked to the cases/policies of an ingestion run (ids as written to the checkpoint file)
+TOUCHED_ENTITIES_CYPHER = """
+MATCH (n) WHERE (n:CourtCase OR n:Policy) AND n.id IN $ids
+MATCH (n)-->(e) WHERE e.name IS NOT NULL
+RETURN DISTINCT e.name AS name
+"""
+
+
+def _ids_hash(ids: List[str]) -> str:
+    """Fingerprint of the processed checkpoint lines, so refresh() notices when they were edited."""
+    return hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest()
+
+
+class GraphSnapshot:
+    """
+    Key-value store: entity name -> {"name", "labels", "cases": [{case, year}], "policies": [{policy, relation, date}]}.
+
+    The file records the ingestion checkpoint it was built against (stat + a hash of its lines).
+    is_fresh() is False once the checkpoint's lines differ from those, e.g. after an ingestion run or a purge
+    (or the snapshot is older than max_age).
+    refresh() rebuilds from scratch when lines it already processed were removed or changed.
+    """
+
+    def __init__(self, path: str = "graph_snapshot.db", checkpoint_file: str = "ingestion_checkpoint.txt",
+                 max_age_seconds: float = None, read_only: bool = True):
+        self.path = path
+        self.checkpoint_file = checkpoint_file
+        self.max_age_seconds = max_age_seconds
+        self.read_only = read_only
+        self._local = threading.local()
+        if not read_only:
+            with self._conn() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS entity (name TEXT PRIMARY KEY, data TEXT NOT NULL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; the engines may look up entities from worker threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+            self._local.conn = conn
+        return conn
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    # --- READ ---
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM entity WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def meta(self, key: str, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def is_fresh(self) -> bool:
+        if not self.exists():
+            return False
+        # Cached per thread for a second, so a burst of lookups costs one stat() call
+        now = time.monotonic()
+        cached = getattr(self._local, "fresh", None)
+        if cached and now - cached[0] < 1.0:
+            return cached[1]
+
+        built_at = float(self.meta("built_at", 0))
+        stat = self._checkpoint_stat()
+        if stat == self.meta("checkpoint_stat"):
+            fresh = True
+        else:
+            # Size or mtime moved: only the lines tell whether it is still the checkpoint we were built from
+            # (a purge followed by an ingest can bring the file back to the same size)
+            checked = getattr(self._local, "checked", None)
+            if not checked or checked[0] != stat:
+                ids = self._read_checkpoint()
+                same = len(ids) == int(self.meta("checkpoint_lines", -1)) and _ids_hash(ids) == self.meta("checkpoint_hash")
+                self._local.checked = checked = (stat, same)
+            fresh = checked[1]
+        if fresh and self.max_age_seconds is not None:
+            fresh = time.time() - built_at <= self.max_age_seconds
+        self._local.fresh = (now, fresh)
+        return fresh
+
+    def _checkpoint_stat(self) -> str:
+        if not os.path.exists(self.checkpoint_file): return "missing"
+        st = os.stat(self.checkpoint_file)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    # --- WRITE ---
+    def _upsert(self, rows: Iterable[Dict[str, Any]]) -> int:
+        merged: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            entry = merged.setdefault(row["name"], {"name": row["name"], "labels": [], "cases": [], "policies": []})
+            entry["labels"] += [l for l in row["labels"] if l not in entry["labels"]]
+            entry["cases"] += [c for c in row["cases"] if c.get("case") is not None]
+            entry["policies"] += [p for p in row["policies"] if p.get("policy") is not None]
+
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entity (name, data) VALUES (?, ?)",
+                ((name, json.dumps(entry, ensure_ascii=False)) for name, entry in merged.items())
+            )
+        return len(merged)
+
+    def _mark_built(self, processed_ids: List[str]):
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ("built_at", str(time.time())),
+                ("checkpoint_stat", self._checkpoint_stat()),
+                ("checkpoint_lines", str(len(processed_ids))),
+                ("checkpoint_hash", _ids_hash(processed_ids)),
+            ])
+        self._local.fresh = None
+
+    def _read_checkpoint(self) -> List[str]:
+        if not os.path.exists(self.checkpoint_file): return []
+        with open(self.checkpoint_file, "r") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def build(self, driver, database: str = None):
+        """Full export of every named node."""
+        ids = self._read_checkpoint()
+        start = time.perf_counter()
+        cypher = NEIGHBOURHOOD_CYPHER.format(where="")
+        with driver.session(database=database) as session:
+            rows = session.execute_read(lambda tx: [r.data() for r in tx.run(cypher, limit=NEIGHBOURS_PER_ENTITY)])
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM entity")
+        count = self._upsert(rows)
+        self._mark_built(ids)
+        logger.info(f"📸 Snapshot built: {count} entities in {time.perf_counter() - start:.1f}s -> {self.path}")
+
+    def refresh(self, driver, database: str = None, batch_size: int = 500):
+        """Re-exports only the entities linked to records ingested since the last build/refresh."""
+        ids = self._read_checkpoint()
+        done = int(self.meta("checkpoint_lines", 0))
+        if done > len(ids) or _ids_hash(ids[:done]) != self.meta("checkpoint_hash"):
+            # Lines were removed or rewritten (clean_bad_ingestion.py), so the offset no longer points past
+            # what this snapshot has seen, and purged records may still be in it: export everything again
+            logger.info("⚠️ Checkpoint changed before the last processed line; rebuilding the whole snapshot.")
+            self.build(driver, database)
+            return
+        new_ids = ids[done:]
+        if not new_ids:
+            self._mark_built(ids)
+            logger.info("✅ Snapshot already up to date.")
+            return
+
+        start = time.perf_counter()
+        cypher = NEIGHBOURHOOD_CYPHER.format(where="AND e.name IN $names")
+        count = 0
+        with driver.session(database=database) as session:
+            for i in range(0, len(new_ids), batch_size):
+                batch = new_ids[i:i + batch_size]
+                names = session.execute_read(lambda tx: [r["name"] for r in tx.run(TOUCHED_ENTITIES_CYPHER, ids=batch)])
+                if not names: continue
+                rows = session.execute_read(lambda tx: [r.data() for r in tx.run(cypher, names=names, limit=NEIGHBOURS_PER_ENTITY)])
+                count += self._upsert(rows)
+        self._mark_built(ids)
+        logger.info(f"🔄 Snapshot refreshed: {len(new_ids)} new records, {count} entities updated in {time.perf_counter() - start:.1f}s")
+
+
+# ==========================================
+# EXAMPLE USAGE
+# ==========================================
+if __name__ == "__main__":
+    from neo4j import GraphDatabase
+
+    NEO4J_URI = "neo4j+s://0dc47c9f.databases.neo4j.io"
+    NEO4J_AUTH = ("neo4j", os.getenv("NEO_API_KEY"))
+
+    parser = argparse.ArgumentParser(description="Export entity neighbourhoods from Neo4j into a local snapshot")
+    parser.add_argument("mode", choices=["build", "refresh"])
+    parser.add_argument("--snapshot", default="graph_snapshot.db")
+    parser.add_argument("--checkpoint", default="ingestion_checkpoint.txt")
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot(args.snapshot, checkpoint_file=args.checkpoint, read_only=False)
+    driver = GraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH)
+    try:
+        if args.mode == "build" or not snapshot.meta("built_at"):
+            snapshot.build(driver)
+        else:
+            snapshot.refresh(driver)
+    finally:
+        driver.close()
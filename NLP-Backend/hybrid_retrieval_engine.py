@@ -8,10 +8,20 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from sentence_transformers import SentenceTransformer
 from pinecone import Pinecone
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, READ_ACCESS
+from neo4j.exceptions import ClientError
 import google.generativeai as genai
+from query_filters import parse_query_filters, to_index_filter
+from context_assembler import ContextAssembler, make_token_counter
+from retrieval_metrics import MetricsRegistry, StageTimer
+from graph_snapshot import GraphSnapshot
 import json
 import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from dotenv import load_dotenv
 
 
@@ -21,7 +31,45 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class LocalEmbeddings:
+    """Gives a SentenceTransformer the embed_query / embed_documents interface of LangChain embeddings."""
+
+    def __init__(self, model: SentenceTransformer):
+        self.model = model
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.encode(text).tolist()
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=32).tolist()
+
+# Characters with a meaning in Lucene query syntax
+LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+def to_fulltext_query(name: str) -> str:
+    """
+    Lucene query for one extracted name: the exact phrase (boosted) OR any of its words (fuzzy for longer words).
+    "Royal Dutch Shell" -> '"royal dutch shell"^3 royal~1 dutch~1 shell~1'
+    """
+    terms = [LUCENE_SPECIAL.sub(r"\\\1", t) for t in name.lower().split()]
+    if not terms:
+        return '""'
+    words = " ".join(t + "~1" if len(t) > 3 else t for t in terms)
+    return f'"{" ".join(terms)}"^3 {words}'
+
+def _is_missing_fulltext_index(error: Exception) -> bool:
+    """True for the Neo4j errors that mean the full-text index (or the procedure) does not exist."""
+    if not isinstance(error, ClientError):
+        return False
+    code = getattr(error, "code", None) or ""
+    return code.endswith("ProcedureNotFound") or (
+        code.endswith("ProcedureCallFailed") and "no such fulltext schema index" in str(error).lower()
+    )
+
 class HybridRetrievalEngine:
+    # Stages that call an LLM (each one can be routed to its own model, see stage_models)
+    LLM_STAGES = ("entity_extraction", "synthesis")
+
     def __init__(
         self, 
         pinecone_api_key: str,
@@ -31,20 +79,63 @@ class HybridRetrievalEngine:
         google_api_key: str = None,
         use_ollama: bool = False,
         ollama_model: str = "llama3",
-        embedding_model_type: str = "minilm" # 'google' or 'minilm' (MUST match what you used for ingestion!)
+        embedding_model_type: str = "minilm", # 'google' or 'minilm' (MUST match what you used for ingestion!)
+        use_query_filters: bool = True,
+        vector_index = None,
+        context_token_budget: int = 3000,
+        vector_context_share: float = 0.6,
+        metrics: MetricsRegistry = None,
+        llm = None,
+        embedder = None,
+        neo4j_driver = None,
+        neo4j_database: str = None,
+        neo4j_pool_size: int = 100,
+        neo4j_acquisition_timeout: float = 60.0,
+        neo4j_max_connection_lifetime: float = 3600.0,
+        graph_snapshot: GraphSnapshot = None,
+        stage_models: Dict[str, Dict[str, Any]] = None,
+        entity_index: str = "entity_names",
+        entity_min_score: float = 1.0
     ):
         """
         Args:
             embedding_model_type: MUST match the model used in knowledge_graph_builder.py 
                                   ('minilm' = 384 dims, 'google' = 768 dims)
+            use_query_filters: Derive type/jurisdiction/year filters from the question and push them to the index.
+            vector_index: Optional local index with the Pinecone query interface (e.g. query_filters.InMemoryVectorIndex).
+                          If given, Pinecone is not used.
+            context_token_budget: Max tokens of (vector + graph) context sent to synthesis. None = no limit.
+            vector_context_share: Part of the budget reserved for the vector leg (the rest goes to the graph leg).
+            metrics: Optional shared MetricsRegistry (stage latency histograms + LLM token counters).
+            llm / embedder / neo4j_driver: Optional pre-built clients (shared clients, or recorded fixtures
+                          in retrieval_benchmark.py). Each one replaces the client the engine would create.
+            neo4j_database: Database name (None = server default). Naming it saves a routing round-trip on clusters.
+            neo4j_pool_size / neo4j_acquisition_timeout / neo4j_max_connection_lifetime:
+                          Driver connection pool settings (timeouts in seconds). Size the pool for the concurrency you serve.
+            graph_snapshot: Optional GraphSnapshot (graph_snapshot.py). Entities are answered from it while it is fresh;
+                          Neo4j is only queried on a miss or after ingestion has made it stale.
+            stage_models: Optional per-stage LLM routing. Stages not listed use the main LLM. Example:
+                          {"entity_extraction": {"provider": "ollama", "model": "llama3.2:1b", "timeout": 5, "fallback": "default"},
+                           "synthesis": {"provider": "gemini", "model": "gemini-2.5-flash", "timeout": 60}}
+                          timeout is in seconds. On a timeout or error the fallback answers instead
+                          ("default" = the main LLM, or another {"provider", "model", ...} spec).
+            entity_index: Neo4j full-text index over entity names (created by knowledge_graph_builder.py).
+                          Extracted names are resolved through it in one query; None = exact name match only.
+            entity_min_score: Lucene score a full-text hit needs to count as the same entity.
         """
         self.use_ollama = use_ollama
         self.embedding_type = embedding_model_type
+        self.use_query_filters = use_query_filters
+        self.metrics = metrics or MetricsRegistry()
         
         # --- 1. SETUP LLM (The Reasoning Brain) ---
-        if self.use_ollama:
+        if llm is not None:
+            self.llm = llm
+            self.llm_model_name = getattr(llm, "model_name", None) or getattr(llm, "model", "custom")
+        elif self.use_ollama:
             logger.info(f"🤖 Using Ollama ({ollama_model}) for reasoning...")
             self.llm = ChatOllama(model=ollama_model, temperature=0)
+            self.llm_model_name = ollama_model
         else:
             if not google_api_key:
                 raise ValueError("Google API Key required for Gemini.")
@@ -55,71 +146,231 @@ class HybridRetrievalEngine:
                 google_api_key=google_api_key,
                 temperature=0
             )
+            self.llm_model_name = "gemini-2.5-flash"
+
+        # Per-stage routing (model, timeout, fallback)
+        self.stage_llms = {
+            stage: self._build_stage_llm((stage_models or {}).get(stage, "default"), google_api_key)
+            for stage in self.LLM_STAGES
+        }
+        # Created up front (not on first use), so concurrent ask()/ask_many() calls share one pool
+        timed_routes = [r for route in self.stage_llms.values() for r in self._route_chain(route) if r["timeout"]]
+        self._llm_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm") if timed_routes else None
+        for stage, route in self.stage_llms.items():
+            if route["llm"] is not self.llm:
+                logger.info(f"🔀 {stage} -> {route['model']} (timeout={route['timeout']}s)")
 
         # --- 2. SETUP EMBEDDINGS (For Vector Search) ---
         # CRITICAL: This must match the dimension of your Pinecone index (384 or 768)
-        if self.embedding_type == "google":
+        self.embedding_dim = 768 if self.embedding_type == "google" else 384
+        if embedder is not None:
+            self.embedder = embedder
+        elif self.embedding_type == "google":
             if not google_api_key: raise ValueError("Google API Key required for embeddings.")
             self.embedder = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=google_api_key)
-            self.embedding_dim = 768
         else:
             # We use raw SentenceTransformer here to ensure exact match with builder script
             self.local_embedder = SentenceTransformer('all-MiniLM-L6-v2')
-            self.embedding_dim = 384
+            self.embedder = LocalEmbeddings(self.local_embedder)
 
         # --- 3. CONNECT TO DATABASES ---
-        # Pinecone
-        self.pc = Pinecone(api_key=pinecone_api_key)
-        self.index = self.pc.Index(pinecone_index_name)
+        # Pinecone (or a local index with the same interface)
+        if vector_index is not None:
+            self.index = vector_index
+        else:
+            self.pc = Pinecone(api_key=pinecone_api_key)
+            self.index = self.pc.Index(pinecone_index_name)
         
-        # Neo4j
-        self.driver = GraphDatabase.driver(neo4j_uri, auth=neo4j_auth)
+        # Neo4j (lookups run as managed read transactions, so a cluster can route them to any member)
+        self.neo4j_database = neo4j_database
+        self.neo4j_pool_size = neo4j_pool_size
+        self._graph_in_flight = 0
+        self._graph_peak_in_flight = 0
+        self._graph_lock = threading.Lock()
+        self.driver = neo4j_driver or GraphDatabase.driver(
+            neo4j_uri,
+            auth=neo4j_auth,
+            max_connection_pool_size=neo4j_pool_size,
+            connection_acquisition_timeout=neo4j_acquisition_timeout,
+            max_connection_lifetime=neo4j_max_connection_lifetime
+        )
         self.driver.verify_connectivity()
+        self.graph_snapshot = graph_snapshot
+        self.entity_index = entity_index
+        self.entity_min_score = entity_min_score
+        if graph_snapshot is not None and not graph_snapshot.exists():
+            logger.warning(f"⚠️ Graph snapshot {graph_snapshot.path} not found. Run graph_snapshot.py build.")
+            self.graph_snapshot = None
         logger.info("✅ Connected to Pinecone and Neo4j.")
 
+        # --- 4. CONTEXT BUDGET ---
+        self.count_tokens = make_token_counter(self.llm_model_name)
+        self.context_assembler = None
+        if context_token_budget:
+            self.context_assembler = ContextAssembler(
+                token_budget=context_token_budget,
+                vector_share=vector_context_share,
+                token_counter=self.count_tokens
+            )
+
+    # =======================================================
+    # ⏱️ INSTRUMENTATION
+    # =======================================================
+    def _new_timer(self) -> StageTimer:
+        return StageTimer(self.metrics, engine=type(self).__name__)
+
+    def _make_llm(self, provider: str, model: str, google_api_key: str = None, timeout: float = None):
+        if provider == "ollama":
+            return ChatOllama(model=model, temperature=0, timeout=timeout)
+        if provider == "gemini":
+            if not google_api_key:
+                raise ValueError("Google API Key required for Gemini.")
+            return ChatGoogleGenerativeAI(model=model, google_api_key=google_api_key, temperature=0, timeout=timeout)
+        raise ValueError(f"Unknown LLM provider '{provider}' (use 'ollama' or 'gemini').")
+
+    def _build_stage_llm(self, spec, google_api_key: str = None) -> Dict[str, Any]:
+        """Turns a stage_models entry into a route: {"llm", "model", "timeout", "fallback" (route or None)}."""
+        if spec == "default":
+            return {"llm": self.llm, "model": self.llm_model_name, "timeout": None, "fallback": None}
+        llm = spec.get("llm") or self._make_llm(spec["provider"], spec["model"], google_api_key, spec.get("timeout"))
+        return {
+            "llm": llm,
+            "model": spec.get("model") or getattr(llm, "model", "custom"),
+            "timeout": spec.get("timeout"),
+            "fallback": self._build_stage_llm(spec["fallback"], google_api_key) if spec.get("fallback") else None,
+        }
+
+    @staticmethod
+    def _route_chain(route: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The route followed by its fallbacks."""
+        chain = []
+        while route is not None:
+            chain.append(route)
+            route = route["fallback"]
+        return chain
+
+    def _call_llm(self, route: Dict[str, Any], messages):
+        if not route["timeout"]:
+            return route["llm"].invoke(messages)
+        # Hard deadline, also for clients that ignore their own timeout setting. The client built by _make_llm
+        # gets the same timeout, so the request behind a timed-out call is aborted and frees its pool thread.
+        return self._llm_pool.submit(route["llm"].invoke, messages).result(timeout=route["timeout"])
+
+    def _invoke_llm(self, stage: str, template: str, variables: Dict[str, Any], timer: StageTimer = None) -> str:
+        """
+        Runs one prompt through the stage's LLM (falling back on timeout/error) and counts the tokens sent and received.
+        Uses the provider's usage metadata when available, otherwise the local token estimate.
+        Latency per model is observed as the 'llm_<stage>' stage.
+        """
+        engine = type(self).__name__
+        route = self.stage_llms.get(stage) or self._build_stage_llm("default")
+        messages = ChatPromptTemplate.from_template(template).format_messages(**variables)
+        while True:
+            start = time.perf_counter()
+            try:
+                message = self._call_llm(route, messages)
+                break
+            except Exception as e:
+                if route["fallback"] is None:
+                    raise
+                reason = "timeout" if isinstance(e, FuturesTimeout) else "error"
+                logger.warning(f"⚠️ {stage} on {route['model']} failed ({reason}), falling back to {route['fallback']['model']}")
+                self.metrics.inc("retrieval_llm_fallbacks_total", engine=engine, stage=stage, model=route["model"], reason=reason)
+                route = route["fallback"]
+        self.metrics.observe(f"llm_{stage}", time.perf_counter() - start, engine=engine, model=route["model"])
+        text = StrOutputParser().invoke(message)
+
+        usage = getattr(message, "usage_metadata", None) or {}
+        sent = usage.get("input_tokens") or sum(self.count_tokens(str(m.content)) for m in messages)
+        received = usage.get("output_tokens") or self.count_tokens(text)
+        self.metrics.add_tokens(stage, sent, received, engine=engine, model=route["model"])
+        if timer is not None:
+            timer.add_tokens(stage, sent, received)
+            timer.models[stage] = route["model"]
+        return text
+
     def _get_query_embedding(self, text: str) -> List[float]:
         """Helper to get embedding based on selected model."""
-        if self.embedding_type == "google":
-            return self.embedder.embed_query(text)
-        else:
-            return self.local_embedder.encode(text).tolist()
+        return self.embedder.embed_query(text)
+
+    def _get_query_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embeds a list of questions in one batched call (same model as _get_query_embedding)."""
+        if not texts:
+            return []
+        return self.embedder.embed_documents(texts, task_type="retrieval_query")
 
     # =======================================================
     # 🧠 LEG 1: VECTOR SEARCH (Pinecone)
     # =======================================================
-    def query_vector_store(self, query: str, top_k: int = 5) -> str:
+    def query_vector_store(self, query: str, top_k: int = 5, vector: List[float] = None,
+                           metadata_filter: Dict[str, Any] = None) -> str:
         """
         Searches Pinecone for semantically similar case descriptions.
         Returns a single string of context.
         """
+        matches = self.search_vectors(query, top_k=top_k, vector=vector, metadata_filter=metadata_filter)
+        return "\n".join(self._format_match(match) for match in matches)
+
+    def search_vectors(self, query: str, top_k: int = 5, vector: List[float] = None,
+                       metadata_filter: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Searches Pinecone and returns the raw matches (id, score, metadata).
+
+        Args:
+            vector: Optional pre-computed query embedding (e.g. from a batch in ask_many).
+            metadata_filter: Optional Pinecone metadata filter. If omitted (and use_query_filters is on),
+                             one is derived from the question, e.g. "policies in the EU since 2020".
+        """
         logger.info(f"🔍 Vector Search for: '{query}'")
-        vector = self._get_query_embedding(query)
-        
-        results = self.index.query(
-            vector=vector,
-            top_k=top_k,
-            include_metadata=True
-        )
-        
-        context_pieces = []
-        for match in results['matches']:
-            meta = match['metadata']
-            score = match['score']
-            # Format: [Title (Year)] Description...
-            piece = f"[CASE: {meta.get('case_name', 'Unknown')} ({meta.get('year', 'N/A')})] (Score: {score:.2f})\n{meta.get('text', '')}\n"
-            context_pieces.append(piece)
-            
-        return "\n".join(context_pieces)
+        if vector is None:
+            vector = self._get_query_embedding(query)
+
+        if metadata_filter is None and self.use_query_filters:
+            metadata_filter = to_index_filter(parse_query_filters(query))
+
+        results = None
+        if metadata_filter:
+            logger.info(f"🔎 Metadata filter: {metadata_filter}")
+            results = self.index.query(
+                vector=vector,
+                top_k=top_k,
+                include_metadata=True,
+                filter=metadata_filter
+            )
+            if not results['matches']:
+                # The parser can be wrong (or the metadata spelled differently), so never return nothing
+                logger.info("⚠️ Filtered search returned no matches. Retrying without filter.")
+                results = None
+
+        if results is None:
+            results = self.index.query(
+                vector=vector,
+                top_k=top_k,
+                include_metadata=True
+            )
+
+        return list(results['matches'])
+
+    def _format_match(self, match) -> str:
+        """Formats a single Pinecone match as a context piece."""
+        meta = match['metadata']
+        score = match['score']
+        # Format: [Title (Year)] Description...
+        return f"[CASE: {meta.get('case_name', 'Unknown')} ({meta.get('year', 'N/A')})] (Score: {score:.2f})\n{meta.get('text', '')}\n"
+
+    def _vector_items(self, matches) -> List[Dict[str, Any]]:
+        """Wraps matches as context items for the ContextAssembler."""
+        return [{
+            "text": self._format_match(match),
+            "score": match['score'],
+            "doc": match['metadata'].get('case_name') or match['metadata'].get('title'),
+            "truncatable": True
+        } for match in matches]
 
     # =======================================================
     # 🕸️ LEG 2: GRAPH SEARCH (Neo4j)
     # =======================================================
-    def extract_entities_for_graph(self, query: str) -> List[str]:
-        """
-        Uses the LLM to figure out which Entities (Companies, Pollutants, etc.) 
-        are in the user's question so we can query the Graph.
-        """
-        prompt = ChatPromptTemplate.from_template("""
+    EXTRACTION_TEMPLATE = """
         Extract the key named entities from this user query that would likely exist in a climate litigation database.
         Focus on: Companies, Jurisdictions (Countries/Cities), Specific Laws, Pollutants, or Harms.
         
@@ -127,71 +378,230 @@ class HybridRetrievalEngine:
         
         Return ONLY a comma-separated list of names. If none, return "NONE".
         Example Output: Shell, Nigeria, Carbon Dioxide
-        """)
-        
-        chain = prompt | self.llm | StrOutputParser()
-        response = chain.invoke({"query": query})
+        """
+
+    def extract_entities_for_graph(self, query: str, timer: StageTimer = None) -> List[str]:
+        """
+        Uses the LLM to figure out which Entities (Companies, Pollutants, etc.) 
+        are in the user's question so we can query the Graph.
+        """
+        response = self._invoke_llm("entity_extraction", self.EXTRACTION_TEMPLATE, {"query": query}, timer)
         
         if "NONE" in response: return []
         return [x.strip() for x in response.split(",")]
 
-    def query_graph_db(self, entities: List[str]) -> str:
+    def query_graph_db(self, entities: List[str], facts: Dict[str, List[Dict[str, Any]]] = None) -> str:
         """
         Queries Neo4j for facts connected to the extracted entities.
+
+        Args:
+            facts: Optional pre-fetched {entity: [facts]} (shared across a batch in ask_many).
         """
         if not entities:
             return "No specific entities identified for Graph Search."
             
         logger.info(f"🕸️ Graph Search for entities: {entities}")
         
-        context_lines = []
-        with self.driver.session() as session:
-            for entity in entities:
-                # 1. Find Cases MENTIONING this entity
-                # We look for the entity node (e) and find cases (c) connected to it
-                cypher = """
-                MATCH (e {name: $name})<-[:MENTIONS]-(c:CourtCase)
-                RETURN e.name as Entity, labels(e) as Type, c.name as Case, c.year as Year
-                LIMIT 5
-                """
-                result = session.run(cypher, name=entity)
-                
-                found = False
-                for record in result:
-                    found = True
-                    line = f"- The entity '{record['Entity']}' ({record['Type'][0]}) is involved in case '{record['Case']}' ({record['Year']})."
-                    context_lines.append(line)
-                
-                if not found:
-                    # Fallback: Try to find what extracted extracted entity is (e.g. "What is Methane?")
-                    cypher_fallback = "MATCH (e {name: $name}) RETURN labels(e) as Type LIMIT 1"
-                    res_fallback = session.run(cypher_fallback, name=entity).single()
-                    if res_fallback:
-                        context_lines.append(f"- '{entity}' exists in the database as a {res_fallback['Type'][0]}.")
+        if facts is None:
+            facts = self._fetch_graph_facts(entities)
 
+        context_lines = [item["text"] for item in self._graph_items(entities, facts)]
         return "\n".join(context_lines) if context_lines else "No direct graph connections found for these entities."
 
-    # =======================================================
-    # 🚀 HYBRID ORCHESTRATOR
-    # =======================================================
-    def ask(self, query: str) -> str:
+    def _graph_items(self, entities: List[str], facts: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
         """
-        The main entry point.
-        1. Get Vector Context
-        2. Get Graph Context
-        3. Synthesize Answer via LLM
+        Flattens per-entity facts into context items for the ContextAssembler.
+        Facts are ranked per entity, so the first fact of every entity outranks the second of any.
         """
-        print(f"\n🤔 USER ASKS: {query}")
-        
-        # 1. Parallel Retrieval (Conceptually)
-        vector_context = self.query_vector_store(query)
+        items = []
+        for entity in dict.fromkeys(entities):
+            for rank, fact in enumerate(facts.get(entity, [])):
+                items.append({"text": fact["text"], "score": 1.0 / (1 + rank), "doc": fact.get("doc"), "truncatable": False})
+        return items
+
+    def _fetch_graph_facts(self, entities: List[str], timings: Dict[str, float] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Looks up each distinct entity once and returns {entity: [facts]}.
+        If a timings dict is given, the lookup time (seconds) per entity is stored in it.
+        """
+        facts = {}
+        pending = list(dict.fromkeys(entities))
+        engine = type(self).__name__
+
+        snapshot = None
+        if self.graph_snapshot is not None and pending:
+            if self.graph_snapshot.is_fresh():
+                snapshot = self.graph_snapshot
+            else:
+                self.metrics.inc("graph_snapshot_stale_total", len(pending), engine=engine)
+
+        # 1. Exact names found in the local snapshot need no round-trip at all
+        if snapshot is not None:
+            misses = []
+            for entity in pending:
+                start = time.perf_counter()
+                neighbourhood = snapshot.get(entity)
+                if neighbourhood is None:
+                    misses.append(entity)
+                    continue
+                facts[entity] = self._facts_from_neighbourhood(entity, neighbourhood)
+                if timings is not None:
+                    timings[entity] = time.perf_counter() - start
+            self.metrics.inc("graph_snapshot_hits_total", len(pending) - len(misses), engine=engine)
+            pending = misses
+
+        if not pending:
+            return facts
+
+        with self._read_session() as session:
+            # 2. Resolve the remaining names through the full-text index (one query for all of them)
+            start = time.perf_counter()
+            resolved = self._resolve_entities(session, pending)
+            resolve_share = (time.perf_counter() - start) / len(pending)
+
+            # 3. Look up each resolved node once (snapshot first, then Neo4j)
+            by_name = {}
+            for entity in pending:
+                start = time.perf_counter()
+                name = resolved.get(entity)
+                if name is None:
+                    facts[entity] = []
+                elif name in by_name:
+                    facts[entity] = by_name[name]
+                else:
+                    neighbourhood = snapshot.get(name) if snapshot is not None else None
+                    if neighbourhood is not None:
+                        by_name[name] = self._facts_from_neighbourhood(name, neighbourhood)
+                    else:
+                        if snapshot is not None:
+                            self.metrics.inc("graph_snapshot_misses_total", engine=engine)
+                        by_name[name] = session.execute_read(self._lookup_entity, name)
+                    facts[entity] = by_name[name]
+                if timings is not None:
+                    timings[entity] = resolve_share + time.perf_counter() - start
+        return facts
+
+    def _resolve_entities(self, session, names: List[str]) -> Dict[str, str]:
+        """
+        Maps extracted names to node names via the full-text index: {extracted: node name}.
+        Names without a hit above entity_min_score are left out (they have no facts, so no lookup is wasted on them).
+        Without an index every name maps to itself (exact match, as before).
+        """
+        if not self.entity_index:
+            return {name: name for name in names}
+        cypher = """
+        UNWIND $queries AS q
+        CALL {
+            WITH q
+            CALL db.index.fulltext.queryNodes($index, q.lucene) YIELD node, score
+            WHERE score >= $min_score
+            RETURN node.name AS match, score
+            ORDER BY score DESC
+            LIMIT 1
+        }
+        RETURN q.name AS name, match, score
+        """
+        queries = [{"name": name, "lucene": to_fulltext_query(name)} for name in names]
+        try:
+            records = session.execute_read(lambda tx: [dict(r) for r in tx.run(
+                cypher, queries=queries, index=self.entity_index, min_score=self.entity_min_score
+            )])
+        except Exception as e:
+            if _is_missing_fulltext_index(e):
+                # Index not built yet: stop asking for it and keep working with exact names
+                logger.warning(f"⚠️ Full-text entity resolution unavailable ({e}). Run knowledge_graph_builder.py to create '{self.entity_index}'.")
+                self.entity_index = None
+            else:
+                # Timeout, dropped connection, ...: exact names for this call only, the index is tried again next time
+                logger.warning(f"⚠️ Full-text entity resolution failed ({e}); using exact names for this query.")
+            return {name: name for name in names}
+
+        resolved = {r["name"]: r["match"] for r in records}
+        engine = type(self).__name__
+        self.metrics.inc("graph_entities_unresolved_total", len(names) - len(resolved), engine=engine)
+        self.metrics.inc("graph_entities_fuzzy_total", sum(1 for k, v in resolved.items() if k != v), engine=engine)
+        for name, match in resolved.items():
+            if name != match:
+                logger.info(f"🔎 Resolved '{name}' -> '{match}'")
+        return resolved
+
+    def _facts_from_neighbourhood(self, entity: str, neighbourhood: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Same facts as _lookup_entity, built from a snapshot entry instead of Neo4j."""
+        context_lines = []
+        entity_type = neighbourhood["labels"][0] if neighbourhood["labels"] else "Entity"
+        for c in neighbourhood["cases"][:5]:
+            line = f"- The entity '{neighbourhood['name']}' ({entity_type}) is involved in case '{c['case']}' ({c['year']})."
+            context_lines.append({"text": line, "doc": c['case']})
+        if not context_lines and neighbourhood["labels"]:
+            context_lines.append({"text": f"- '{entity}' exists in the database as a {entity_type}.", "doc": None})
+        return context_lines
+
+    @contextmanager
+    def _read_session(self):
+        """
+        Opens a READ session and tracks how many pool connections the engine holds.
+        Exported gauges: neo4j_pool_in_flight, neo4j_pool_peak_in_flight, neo4j_pool_size, neo4j_pool_saturation.
+        """
+        with self._graph_lock:
+            self._graph_in_flight += 1
+            self._graph_peak_in_flight = max(self._graph_peak_in_flight, self._graph_in_flight)
+            self._export_pool_gauges()
+        try:
+            with self.driver.session(database=self.neo4j_database, default_access_mode=READ_ACCESS) as session:
+                yield session
+        except Exception as e:
+            # The driver raises this when no connection frees up within connection_acquisition_timeout
+            if "obtain a connection" in str(e).lower():
+                self.metrics.inc("neo4j_pool_acquisition_timeouts_total", engine=type(self).__name__)
+            raise
+        finally:
+            with self._graph_lock:
+                self._graph_in_flight -= 1
+                self._export_pool_gauges()
+
+    def _export_pool_gauges(self):
+        engine = type(self).__name__
+        self.metrics.set_gauge("neo4j_pool_in_flight", self._graph_in_flight, engine=engine)
+        self.metrics.set_gauge("neo4j_pool_peak_in_flight", self._graph_peak_in_flight, engine=engine)
+        self.metrics.set_gauge("neo4j_pool_size", self.neo4j_pool_size, engine=engine)
+        self.metrics.set_gauge("neo4j_pool_saturation", self._graph_in_flight / max(1, self.neo4j_pool_size), engine=engine)
+
+    def _lookup_entity(self, tx, entity: str) -> List[Dict[str, Any]]:
+        """
+        Read transaction function: returns the graph facts for a single entity
+        as {"text": fact line, "doc": linked case/policy name or None}.
+        Records are consumed here, because the driver may retry the whole function.
+        """
+        context_lines = []
+
+        # 1. Find Cases MENTIONING this entity
+        # We look for the entity node (e) and find cases (c) connected to it
+        cypher = """
+        MATCH (e {name: $name})<-[:MENTIONS]-(c:CourtCase)
+        RETURN e.name as Entity, [l IN labels(e) WHERE l <> 'Entity'] as Type, c.name as Case, c.year as Year
+        LIMIT 5
+        """
+        result = tx.run(cypher, name=entity)
         
-        # 2. Entity Extraction & Graph Query
-        entities = self.extract_entities_for_graph(query)
-        graph_context = self.query_graph_db(entities)
+        found = False
+        for record in result:
+            found = True
+            line = f"- The entity '{record['Entity']}' ({(record['Type'] or ['Entity'])[0]}) is involved in case '{record['Case']}' ({record['Year']})."
+            context_lines.append({"text": line, "doc": record['Case']})
         
-        # 3. Synthesis Prompt
-        final_prompt = ChatPromptTemplate.from_template("""
+        if not found:
+            # Fallback: Try to find what extracted extracted entity is (e.g. "What is Methane?")
+            cypher_fallback = "MATCH (e {name: $name}) RETURN [l IN labels(e) WHERE l <> 'Entity'] as Type LIMIT 1"
+            res_fallback = tx.run(cypher_fallback, name=entity).single()
+            if res_fallback:
+                context_lines.append({"text": f"- '{entity}' exists in the database as a {(res_fallback['Type'] or ['Entity'])[0]}.", "doc": None})
+
+        return context_lines
+
+    # =======================================================
+    # 🚀 HYBRID ORCHESTRATOR
+    # =======================================================
+    SYNTHESIS_TEMPLATE = """
         You are a high-level Climate Rights Legal Analyst. 
         Answer the user's question using the provided Context.
         
@@ -211,18 +621,224 @@ class HybridRetrievalEngine:
         4. If the information is missing, admit it.
         
         Answer:
-        """)
-        
-        chain = final_prompt | self.llm | StrOutputParser()
-        
-        print("⚡ Generating Hybrid Response...")
-        response = chain.invoke({
+        """
+
+    def build_context(self, query: str, matches, entities: List[str], facts: Dict[str, List[Dict[str, Any]]]):
+        """
+        Turns vector matches and graph facts into the two context strings for synthesis,
+        trimmed to context_token_budget (lowest scores dropped first, repeated facts removed).
+        Returns (vector_context, graph_context, sources) where sources are the case/policy names that made it in.
+        """
+        vector_items = self._vector_items(matches)
+        graph_items = self._graph_items(entities, facts)
+
+        if self.context_assembler is not None:
+            vector_items, graph_items, stats = self.context_assembler.assemble(vector_items, graph_items)
+            logger.info(
+                f"✂️ Context: {stats['tokens_after']}/{stats['tokens_before']} tokens "
+                f"(saved {stats['tokens_saved']}, dropped {stats['dropped']}, truncated {stats['truncated']}, "
+                f"duplicates {stats['duplicates']}) for '{query[:60]}'"
+            )
+
+        vector_context = "\n".join(item["text"] for item in vector_items)
+        if not entities:
+            graph_context = "No specific entities identified for Graph Search."
+        elif graph_items:
+            graph_context = "\n".join(item["text"] for item in graph_items)
+        else:
+            graph_context = "No direct graph connections found for these entities."
+
+        sources = list(dict.fromkeys(item["doc"] for item in vector_items + graph_items if item.get("doc")))
+        return vector_context, graph_context, sources
+
+    def synthesize(self, query: str, vector_context: str, graph_context: str, timer: StageTimer = None) -> str:
+        """Runs the final synthesis prompt over both context legs."""
+        return self._invoke_llm("synthesis", self.SYNTHESIS_TEMPLATE, {
             "query": query,
             "vector_context": vector_context,
             "graph_context": graph_context
-        })
+        }, timer)
+
+    def ask(self, query: str) -> str:
+        """
+        The main entry point.
+        1. Get Vector Context
+        2. Get Graph Context
+        3. Synthesize Answer via LLM
+        """
+        print(f"\n🤔 USER ASKS: {query}")
+        result = self.ask_detailed(query)
+        timings = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in result["timings"].items())
+        logger.info(f"⏱️ {timings}")
+        return result["answer"]
+
+    def ask_detailed(self, query: str, top_k: int = 5) -> Dict[str, Any]:
+        """
+        Same pipeline as ask(), but returns the answer with its timing breakdown:
+            {"query", "answer", "entities", "sources", "timings" (seconds per stage), "tokens" (per LLM stage),
+             "models" (model that answered each LLM stage)}
+        """
+        timer = self._new_timer()
+        entities, vector_context, graph_context, sources = self._retrieve_context(query, top_k, timer)
+        
+        # 4. Synthesis
+        print("⚡ Generating Hybrid Response...")
+        with timer.stage("synthesis"):
+            answer = self.synthesize(query, vector_context, graph_context, timer=timer)
+
+        return {
+            "query": query,
+            "answer": answer,
+            "entities": entities,
+            "sources": sources,
+            "timings": timer.finish(),
+            "tokens": timer.tokens,
+            "models": timer.models
+        }
+
+    def _retrieve_context(self, query: str, top_k: int, timer: StageTimer):
+        """Steps 1-3 of the pipeline. Returns (entities, vector_context, graph_context, sources)."""
+        # 1. Parallel Retrieval (Conceptually)
+        with timer.stage("embedding"):
+            vector = self._get_query_embedding(query)
+        with timer.stage("vector_search"):
+            matches = self.search_vectors(query, top_k=top_k, vector=vector)
         
-        return response
+        # 2. Entity Extraction & Graph Query
+        with timer.stage("entity_extraction"):
+            entities = self.extract_entities_for_graph(query, timer=timer)
+        with timer.stage("graph_search"):
+            facts = self._fetch_graph_facts(entities) if entities else {}
+        
+        # 3. Fit both legs into the context budget
+        with timer.stage("context_assembly"):
+            vector_context, graph_context, sources = self.build_context(query, matches, entities, facts)
+        return entities, vector_context, graph_context, sources
+
+    def ask_stream(self, query: str, top_k: int = 5):
+        """
+        Same pipeline as ask_detailed(), but yields events as they become available:
+            {"event": "context", "entities", "sources"}   once retrieval is done
+            {"event": "token", "text"}                    answer chunks from the synthesis model
+            {"event": "done", "timings", "tokens", "models"}
+        """
+        timer = self._new_timer()
+        entities, vector_context, graph_context, sources = self._retrieve_context(query, top_k, timer)
+        yield {"event": "context", "entities": entities, "sources": sources}
+
+        route = self.stage_llms["synthesis"]
+        messages = ChatPromptTemplate.from_template(self.SYNTHESIS_TEMPLATE).format_messages(
+            query=query, vector_context=vector_context, graph_context=graph_context
+        )
+        chunks = []
+        with timer.stage("synthesis"):
+            for chunk in route["llm"].stream(messages):
+                text = StrOutputParser().invoke(chunk)
+                if text:
+                    chunks.append(text)
+                    yield {"event": "token", "text": text}
+
+        sent = sum(self.count_tokens(str(m.content)) for m in messages)
+        received = self.count_tokens("".join(chunks))
+        self.metrics.add_tokens("synthesis", sent, received, engine=type(self).__name__, model=route["model"])
+        timer.add_tokens("synthesis", sent, received)
+        timer.models["synthesis"] = route["model"]
+        yield {"event": "done", "timings": timer.finish(), "tokens": timer.tokens, "models": timer.models}
+
+    # =======================================================
+    # 📦 BATCH ORCHESTRATOR
+    # =======================================================
+    def ask_many(self, queries: List[str], concurrency: int = 4, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Answers a list of questions in one go.
+        1. Embed all questions in a single batch
+        2. Vector search + entity extraction per question (max `concurrency` at once)
+        3. Graph lookup once per distinct entity across the whole batch
+        4. Synthesis per question (max `concurrency` at once)
+
+        Returns one dict per question, in input order:
+            {"query", "answer", "entities", "sources", "timings" (seconds per stage), "tokens", "models", "error"}
+        A failing question gets its "error" set and does not stop the rest of the batch.
+        """
+        results = [
+            {"query": q, "answer": None, "entities": [], "sources": [], "timings": {}, "tokens": {}, "models": {}, "error": None}
+            for q in queries
+        ]
+        timers = [self._new_timer() for _ in queries]
+        if not queries:
+            return results
+
+        logger.info(f"📦 Batch of {len(queries)} questions (concurrency={concurrency})")
+        batch_start = time.perf_counter()
+
+        # 1. Shared embedding (cost is split evenly over the batch)
+        start = time.perf_counter()
+        try:
+            vectors = self._get_query_embeddings(queries)
+        except Exception as e:
+            logger.error(f"❌ Batch embedding failed: {e}")
+            for res in results:
+                res["error"] = f"embedding: {e}"
+            return results
+        embed_share = (time.perf_counter() - start) / len(queries)
+
+        matches = [None] * len(queries)
+
+        def _retrieve(i):
+            res, timer = results[i], timers[i]
+            timer.add("embedding", embed_share)
+            try:
+                with timer.stage("vector_search"):
+                    matches[i] = self.search_vectors(queries[i], top_k=top_k, vector=vectors[i])
+                with timer.stage("entity_extraction"):
+                    res["entities"] = self.extract_entities_for_graph(queries[i], timer=timer)
+            except Exception as e:
+                logger.error(f"❌ Retrieval failed for question {i}: {e}")
+                res["error"] = f"retrieval: {e}"
+
+        def _synthesize(i):
+            res, timer = results[i], timers[i]
+            if res["error"]:
+                return
+            try:
+                with timer.stage("context_assembly"):
+                    vector_context, graph_context, res["sources"] = self.build_context(
+                        queries[i], matches[i], res["entities"], facts
+                    )
+                with timer.stage("synthesis"):
+                    res["answer"] = self.synthesize(queries[i], vector_context, graph_context, timer=timer)
+            except Exception as e:
+                logger.error(f"❌ Synthesis failed for question {i}: {e}")
+                res["error"] = f"synthesis: {e}"
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            # 2. Vector search + entity extraction
+            list(pool.map(_retrieve, range(len(queries))))
+
+            # 3. Deduplicated graph lookups
+            all_entities = [e for res in results if not res["error"] for e in res["entities"]]
+            entity_timings = {}
+            try:
+                facts = self._fetch_graph_facts(all_entities, timings=entity_timings)
+            except Exception as e:
+                logger.error(f"❌ Batch graph lookup failed: {e}")
+                facts = {}
+            logger.info(f"🕸️ {len(all_entities)} entity mentions -> {len(entity_timings)} graph lookups")
+            for res, timer in zip(results, timers):
+                timer.add("graph_search", sum(entity_timings.get(e, 0.0) for e in set(res["entities"])))
+
+            # 4. Synthesis
+            list(pool.map(_synthesize, range(len(queries))))
+
+        # 'total' is the work done for each question (queueing in the pool is not counted)
+        for res, timer in zip(results, timers):
+            res["timings"] = timer.finish(total=sum(timer.timings.values()))
+            res["tokens"] = timer.tokens
+            res["models"] = timer.models
+
+        failed = sum(1 for res in results if res["error"])
+        logger.info(f"✅ Batch done in {time.perf_counter() - batch_start:.1f}s ({failed} failed)")
+        return results
 
 # ==========================================
 # EXECUTION BLOCK
@@ -22,6 +22,9 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Full-text index over the names of all :Entity nodes (used by the retrieval engines for fuzzy matching)
+ENTITY_INDEX = "entity_names"
+
 class ClimateKnowledgeBase:
     def __init__(self, pinecone_api_key, pinecone_index_name, neo4j_uri, neo4j_auth, 
                  google_api_key=None, embedding_model="minilm", use_llm_extraction=False, 
@@ -67,6 +70,7 @@ class ClimateKnowledgeBase:
         # 6. Initialize Neo4j
         self.driver = GraphDatabase.driver(neo4j_uri, auth=neo4j_auth)
         self.verify_neo4j_connection()
+        self.ensure_entity_index()
 
 
     # --- CHECKPOINT METHODS ---
@@ -115,6 +119,27 @@ class ClimateKnowledgeBase:
             logger.error(f"Failed to connect to Neo4j: {e}")
             raise
 
+    def ensure_entity_index(self, batch_size=10000):
+        """
+        Every named node except court cases carries the extra :Entity label, and a full-text
+        index over Entity.name lets the retrieval engine resolve fuzzy names ("Royal Dutch Shell" -> "Shell").
+        Labels nodes ingested before the label existed, then creates the index if it is missing.
+        """
+        with self.driver.session() as session:
+            labelled = 0
+            while True:
+                count = session.run("""
+                    MATCH (n) WHERE n.name IS NOT NULL AND NOT n:CourtCase AND NOT n:Entity
+                    WITH n LIMIT $batch
+                    SET n:Entity
+                    RETURN count(n) AS c
+                """, batch=batch_size).single()["c"]
+                if not count: break
+                labelled += count
+            if labelled:
+                logger.info(f"🏷️ Added the :Entity label to {labelled} existing nodes.")
+            session.run(f"CREATE FULLTEXT INDEX {ENTITY_INDEX} IF NOT EXISTS FOR (n:Entity) ON EACH [n.name]")
+
     def _setup_custom_ontology(self):
         """
         Injects domain-specific knowledge into spaCy.
@@ -222,6 +247,16 @@ class ClimateKnowledgeBase:
             # Local embeddings handle truncation internally usually, but safe to truncate
             return self.embedder.encode(text[:8000]).tolist()
 
+    @staticmethod
+    def _format_year(value):
+        """Normalizes a year cell to a plain 'YYYY' string (pandas turns int columns with gaps into 2011.0)."""
+        if value is None or pd.isna(value) or str(value).strip() == "":
+            return ""
+        try:
+            return str(int(float(value)))
+        except (TypeError, ValueError):
+            return str(value)
+
     def extract_entities_spacy(self, text):
         doc = self.nlp(text)
         entities = []
@@ -312,7 +347,7 @@ class ClimateKnowledgeBase:
                     "type": "Case",
                     "case_name": case_name,
                     "jurisdiction": row.get("Jurisdiction", "Unknown"),
-                    "year": str(row.get("Filing Year", "")),
+                    "year": self._format_year(row.get("Filing Year", "")),
                     "text": description[:1000]
                 }
                 
@@ -328,13 +363,22 @@ class ClimateKnowledgeBase:
                     tx.run("""
                         MERGE (c:CourtCase {id: $id})
                         SET c.name = $name, c.description = $desc, c.year = $year
-                    """, id=case_id, name=case_name, desc=description, year=str(row.get("Filing Year", "")))
+                    """, id=case_id, name=case_name, desc=description, year=self._format_year(row.get("Filing Year", "")))
+
+                    # Re-ingest: drop the case's old edges so they are rebuilt from this run's extraction, and stamp
+                    # the entities they pointed to so orphan_gc.py checks them (no-op on a first ingest)
+                    tx.run("""
+                        MATCH (c:CourtCase {id: $id})-[r]->(e:Entity)
+                        SET e.touched_at = timestamp()
+                        DELETE r
+                    """, id=case_id)
 
                     for law in principal_laws:
                         if law.strip():
                             tx.run("""
                                 MATCH (c:CourtCase {id: $id})
                                 MERGE (l:Law {name: $law_name})
+                                SET l:Entity
                                 MERGE (c)-[:CITES]->(l)
                             """, id=case_id, law_name=law.strip())
 
@@ -356,6 +400,7 @@ class ClimateKnowledgeBase:
                             tx.run(f"""
                                 MATCH (c:CourtCase {{id: $id}})
                                 MERGE (e:{label} {{name: $name}})
+                                SET e:Entity
                                 MERGE (c)-[:MENTIONS]->(e)
                             """, id=case_id, name=name)
                     
@@ -444,11 +489,19 @@ class ClimateKnowledgeBase:
                         SET p.title = $title, p.summary = $summary, p.date = $date
                     """, id=policy_id, title=title, summary=summary, date=date_passed)
 
+                    # Re-ingest: same as for cases, old edges go and their entities are stamped for orphan_gc.py
+                    tx.run("""
+                        MATCH (p:Policy {id: $id})-[r]->(e:Entity)
+                        SET e.touched_at = timestamp()
+                        DELETE r
+                    """, id=policy_id)
+
                     # B. Link to Jurisdiction (The Bridge to Litigation)
                     # Note: We match the existing Jurisdiction node created by the Litigation ingestion
                     tx.run("""
                         MATCH (p:Policy {id: $id})
                         MERGE (j:Jurisdiction {name: $geo})
+                        SET j:Entity
                         MERGE (p)-[:APPLIES_TO]->(j)
                     """, id=policy_id, geo=geography)
 
@@ -458,6 +511,7 @@ class ClimateKnowledgeBase:
                             tx.run("""
                                 MATCH (p:Policy {id: $id})
                                 MERGE (s:Sector {name: $sec_name})
+                                SET s:Entity
                                 MERGE (p)-[:REGULATES]->(s)
                             """, id=policy_id, sec_name=sec.strip())
 
@@ -467,6 +521,7 @@ class ClimateKnowledgeBase:
                             tx.run("""
                                 MATCH (p:Policy {id: $id})
                                 MERGE (i:Instrument {name: $instr_name})
+                                SET i:Entity
                                 MERGE (p)-[:USES]->(i)
                             """, id=policy_id, instr_name=instr.strip())
                     
@@ -476,6 +531,7 @@ class ClimateKnowledgeBase:
                             tx.run("""
                                 MATCH (p:Policy {id: $id})
                                 MERGE (k:Keyword {name: $key_name})
+                                SET k:Entity
                                 MERGE (p)-[:TAGGED_WITH]->(k)
                             """, id=policy_id, key_name=keyw.strip())
 
@@ -495,6 +551,7 @@ class ClimateKnowledgeBase:
                             tx.run(f"""
                                 MATCH (p:Policy {{id: $id}})
                                 MERGE (e:{label} {{name: $name}})
+                                SET e:Entity
                                 MERGE (p)-[:ADDRESSES]->(e)
                             """, id=policy_id, name=name)
 
@@ -0,0 +1,142 @@
+### Garbage collection of orphaned entity nodes (Law, Keyword, Sector, ... no case or policy links to anymore).
+### They appear after clean_bad_ingestion.py deletes cases/policies, and only slow down MERGE and full-text lookups.
+### Incremental by default: only entities touched since the last run (clean_bad_ingestion.py stamps
+### e.touched_at on the neighbours of every record it deletes, knowledge_graph_builder.py on the old
+### neighbours of every record it re-ingests). The first run scans every label.
+### Usage: python orphan_gc.py --dry-run     (counts per label, deletes nothing)
+###        python orphan_gc.py               (incremental)
+###        python orphan_gc.py --full        (every :Entity node)
+import os
+import time
+import logging
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+BATCH_SIZE = 1000
+STATE_KEY = "orphan_gc"
+# Labels that are records, not entities (and the GC's own state node)
+SKIP_LABELS = {"CourtCase", "Policy", "Entity", "GcState"}
+
+# Edges from a case/policy to an entity, as written by knowledge_graph_builder.py. Other incoming edges
+# (e.g. from another entity) do not keep a node alive.
+RECORD_EDGES = ("MENTIONS", "CITES", "REGULATES", "APPLIES_TO", "USES", "TAGGED_WITH", "ADDRESSES")
+# A typed EXISTS { (e)<-[:A|B]-() } is answered from the node's degree per relationship type, no relationship scan
+ORPHAN_PREDICATE = f"NOT EXISTS {{ (e)<-[:{'|'.join(RECORD_EDGES)}]-() }}"
+
+
+class OrphanEntityGC:
+    """
+    Finds :Entity nodes without incoming case/policy edges and deletes them in batched write transactions.
+    The last run's start time is kept on a (:GcState {key: 'orphan_gc'}) node in the graph itself.
+    """
+
+    def __init__(self, driver, database: str = None, batch_size: int = BATCH_SIZE):
+        self.driver = driver
+        self.database = database
+        self.batch_size = batch_size
+
+    def ensure_indexes(self):
+        """Range index on Entity.touched_at so the incremental scan is an index seek."""
+        with self.driver.session(database=self.database) as session:
+            session.run("CREATE INDEX entity_touched_at IF NOT EXISTS FOR (n:Entity) ON (n.touched_at)")
+            session.run("CREATE CONSTRAINT gc_state_key IF NOT EXISTS FOR (n:GcState) REQUIRE n.key IS UNIQUE")
+
+    # --- STATE ---
+    def last_run(self) -> Optional[int]:
+        with self.driver.session(database=self.database) as session:
+            record = session.run("MATCH (s:GcState {key: $key}) RETURN s.last_run AS last_run", key=STATE_KEY).single()
+        return record["last_run"] if record else None
+
+    def _mark_run(self, started_at: int):
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(lambda tx: tx.run(
+                "MERGE (s:GcState {key: $key}) SET s.last_run = $started_at", key=STATE_KEY, started_at=started_at
+            ).consume())
+
+    # --- SCAN ---
+    def _entity_labels(self, session) -> List[str]:
+        return [l for l in session.run("CALL db.labels() YIELD label RETURN label").value() if l not in SKIP_LABELS]
+
+    def find_orphans(self, since: Optional[int]) -> List[Tuple[str, List[str]]]:
+        """(elementId, labels) of every orphan; only nodes touched at/after `since` unless since is None."""
+        orphans = []
+        with self.driver.session(database=self.database) as session:
+            if since is not None:
+                orphans += session.execute_read(lambda tx: [(r["id"], r["labels"]) for r in tx.run(f"""
+                    MATCH (e:Entity) WHERE e.touched_at >= $since AND {ORPHAN_PREDICATE}
+                    RETURN elementId(e) AS id, labels(e) AS labels
+                """, since=since)])
+            else:
+                # Full scan one label at a time, so each query stays on that label's node set
+                for label in self._entity_labels(session):
+                    orphans += session.execute_read(lambda tx: [(r["id"], r["labels"]) for r in tx.run(f"""
+                        MATCH (e:`{label}`:Entity) WHERE {ORPHAN_PREDICATE}
+                        RETURN elementId(e) AS id, labels(e) AS labels
+                    """)])
+        # A node with two entity labels shows up under both during the full scan
+        return list(dict(orphans).items())
+
+    # --- DELETE ---
+    def delete(self, element_ids: List[str]) -> int:
+        """Deletes in batches; the degree is checked again so a node linked since the scan survives."""
+        deleted = 0
+        with self.driver.session(database=self.database) as session:
+            for i in range(0, len(element_ids), self.batch_size):
+                batch = element_ids[i:i + self.batch_size]
+                deleted += session.execute_write(lambda tx: tx.run(f"""
+                    UNWIND $ids AS id
+                    MATCH (e:Entity) WHERE elementId(e) = id AND {ORPHAN_PREDICATE}
+                    DETACH DELETE e
+                    RETURN count(*) AS deleted
+                """, ids=batch).single()["deleted"])
+        return deleted
+
+    def run(self, full: bool = False, dry_run: bool = False) -> Dict[str, int]:
+        """Returns orphan counts per label (deleted ones, or would-be-deleted ones on a dry run)."""
+        start = time.perf_counter()
+        self.ensure_indexes()
+        with self.driver.session(database=self.database) as session:
+            started_at = session.run("RETURN timestamp() AS now").single()["now"]  # server clock, like touched_at
+
+        since = None if full else self.last_run()
+        scope = "all entities" if since is None else f"entities touched since {time.strftime('%Y-%m-%d %H:%M', time.localtime(since / 1000))}"
+        orphans = self.find_orphans(since)
+        per_label = Counter(l for _, labels in orphans for l in labels if l not in SKIP_LABELS)
+        logger.info(f"🔍 {len(orphans)} orphaned entities ({scope}): {dict(per_label.most_common())}")
+
+        if dry_run:
+            logger.info("Dry run: nothing deleted.")
+            return dict(per_label)
+        deleted = self.delete([element_id for element_id, _ in orphans])
+        self._mark_run(started_at)
+        logger.info(f"🗑️ Deleted {deleted} orphaned entities in {time.perf_counter() - start:.1f}s")
+        return dict(per_label)
+
+
+# ==========================================
+# EXAMPLE USAGE
+# ==========================================
+if __name__ == "__main__":
+    from neo4j import GraphDatabase
+
+    NEO4J_URI = "neo4j+s://0dc47c9f.databases.neo4j.io"
+    NEO4J_AUTH = ("neo4j", os.getenv("NEO_API_KEY"))
+
+    parser = argparse.ArgumentParser(description="Delete entity nodes that no case or policy points to anymore")
+    parser.add_argument("--full", action="store_true", help="Scan every entity, not only those touched since the last run")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the orphans per label")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Deletes per transaction")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH)
+    try:
+        OrphanEntityGC(driver, batch_size=args.batch_size).run(full=args.full, dry_run=args.dry_run)
+    finally:
+        driver.close()
@@ -0,0 +1,251 @@
+### Cheap local parser that turns a question into metadata filters for the vector index.
+### Uses only the fields knowledge_graph_builder.py writes: 'type', 'jurisdiction' and 'year' (stored as strings).
+import re
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Lower bound for open ranges like "before 2015" (years are strings, so ranges become $in lists)
+MIN_YEAR = 1950
+
+# Canonical jurisdiction -> how it may be written in the question.
+# Values are matched case-insensitively, except short codes (all caps) which must match exactly.
+JURISDICTION_ALIASES = {
+    "European Union": ["European Union", "EU"],
+    "United States": ["United States", "United States of America", "USA", "US", "U.S."],
+    "United Kingdom": ["United Kingdom", "UK", "Britain", "Great Britain", "England"],
+    "Australia": ["Australia"],
+    "New Zealand": ["New Zealand"],
+    "Canada": ["Canada"],
+    "Brazil": ["Brazil"],
+    "Germany": ["Germany"],
+    "France": ["France"],
+    "Netherlands": ["Netherlands", "Holland"],
+    "Belgium": ["Belgium"],
+    "Ireland": ["Ireland"],
+    "Norway": ["Norway"],
+    "Sweden": ["Sweden"],
+    "Switzerland": ["Switzerland"],
+    "Spain": ["Spain"],
+    "Italy": ["Italy"],
+    "Poland": ["Poland"],
+    "India": ["India"],
+    "Pakistan": ["Pakistan"],
+    "China": ["China"],
+    "Japan": ["Japan"],
+    "South Korea": ["South Korea", "Korea"],
+    "Indonesia": ["Indonesia"],
+    "Philippines": ["Philippines"],
+    "South Africa": ["South Africa"],
+    "Nigeria": ["Nigeria"],
+    "Kenya": ["Kenya"],
+    "Mexico": ["Mexico"],
+    "Colombia": ["Colombia"],
+    "Argentina": ["Argentina"],
+    "Chile": ["Chile"],
+    "Peru": ["Peru"],
+    "Ecuador": ["Ecuador"],
+}
+
+# Extra spellings the ingested datasets use for the same jurisdiction (CPR vs Sabin Center)
+JURISDICTION_VARIANTS = {
+    "United States": ["United States", "United States of America", "USA"],
+    "United Kingdom": ["United Kingdom", "UK"],
+    "European Union": ["European Union", "EU"],
+}
+
+POLICY_WORDS = re.compile(r"\b(polic(?:y|ies)|legislation|regulations?|strateg(?:y|ies)|ndcs?)\b", re.I)
+CASE_WORDS = re.compile(r"\b(cases?|litigation|lawsuits?|suits?|courts?|rulings?|judgm?ents?|sued)\b", re.I)
+
+YEAR = r"((?:19|20)\d{2})"
+RANGE_PATTERNS = [
+    re.compile(rf"\bbetween\s+{YEAR}\s+and\s+{YEAR}\b", re.I),
+    re.compile(rf"\bfrom\s+{YEAR}\s+(?:to|until|through)\s+{YEAR}\b", re.I),
+    re.compile(rf"\b{YEAR}\s*(?:-|–|to)\s*{YEAR}\b", re.I),
+]
+SINCE_PATTERN = re.compile(rf"\b(since|after|from)\s+{YEAR}\b", re.I)
+BEFORE_PATTERN = re.compile(rf"\b(before|until|prior to|up to)\s+{YEAR}\b", re.I)
+IN_YEAR_PATTERN = re.compile(rf"\bin\s+{YEAR}\b", re.I)
+
+
+def _alias_pattern(alias: str):
+    escaped = re.escape(alias)
+    if alias.replace(".", "").isupper() and len(alias) <= 4:
+        return re.compile(rf"(?<![\w.]){escaped}(?![\w])")
+    return re.compile(rf"\b{escaped}\b", re.I)
+
+_ALIAS_PATTERNS = [
+    (canonical, _alias_pattern(alias))
+    for canonical, aliases in JURISDICTION_ALIASES.items()
+    for alias in sorted(aliases, key=len, reverse=True)
+]
+
+
+def parse_query_filters(query: str) -> Dict[str, Any]:
+    """
+    Derives structured filters from a free-text question.
+    Example: "policies in the EU since 2020"
+        -> {"type": "Policy", "jurisdictions": ["European Union"], "year_from": 2020, "year_to": None}
+    Keys are only present when something was found.
+    """
+    filters = {}
+    if not query:
+        return filters
+
+    # 1. Document type (only when the question is clearly about one side)
+    wants_policy = bool(POLICY_WORDS.search(query))
+    wants_case = bool(CASE_WORDS.search(query))
+    if wants_policy != wants_case:
+        filters["type"] = "Policy" if wants_policy else "Case"
+
+    # 2. Jurisdictions
+    found = []
+    for canonical, pattern in _ALIAS_PATTERNS:
+        if canonical not in found and pattern.search(query):
+            found.append(canonical)
+    if found:
+        filters["jurisdictions"] = found
+
+    # 3. Year range
+    year_from, year_to = None, None
+    for pattern in RANGE_PATTERNS:
+        m = pattern.search(query)
+        if m:
+            year_from, year_to = sorted([int(m.group(1)), int(m.group(2))])
+            break
+    else:
+        m = SINCE_PATTERN.search(query)
+        if m:
+            year_from = int(m.group(2)) + (1 if m.group(1).lower() == "after" else 0)
+        m = BEFORE_PATTERN.search(query)
+        if m:
+            year_to = int(m.group(2)) - (1 if m.group(1).lower() in ("before", "prior to") else 0)
+        if year_from is None and year_to is None:
+            m = IN_YEAR_PATTERN.search(query)
+            if m:
+                year_from = year_to = int(m.group(1))
+
+    if year_from is not None or year_to is not None:
+        filters["year_from"] = year_from
+        filters["year_to"] = year_to
+
+    return filters
+
+
+def to_index_filter(filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Converts parsed filters into a Pinecone-style metadata filter.
+    'year' is stored as a string, so ranges are expanded into an $in list of years (plus the legacy "YYYY.0" spelling).
+    Returns None when there is nothing to filter on.
+    """
+    clauses = []
+    if filters.get("type"):
+        clauses.append({"type": {"$eq": filters["type"]}})
+
+    if filters.get("jurisdictions"):
+        names = []
+        for canonical in filters["jurisdictions"]:
+            for name in JURISDICTION_VARIANTS.get(canonical, [canonical]):
+                if name not in names:
+                    names.append(name)
+        clauses.append({"jurisdiction": {"$in": names}})
+
+    if filters.get("year_from") is not None or filters.get("year_to") is not None:
+        year_from = filters.get("year_from") or MIN_YEAR
+        year_to = filters.get("year_to") or datetime.now().year
+        years = range(year_from, year_to + 1)
+        # Vectors ingested before knowledge_graph_builder._format_year still carry pandas floats ("2011.0")
+        clauses.append({"year": {"$in": [str(y) for y in years] + [f"{y}.0" for y in years]}})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+# =======================================================
+# 🧮 IN-MEMORY FILTER PATH (Local vector backends)
+# =======================================================
+def matches_filter(metadata: Dict[str, Any], metadata_filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates a Pinecone-style metadata filter against one metadata dict."""
+    if not metadata_filter:
+        return True
+
+    for key, condition in metadata_filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, target in condition.items():
+            if op == "$eq" and value != target: return False
+            elif op == "$ne" and value == target: return False
+            elif op == "$in" and value not in target: return False
+            elif op == "$nin" and value in target: return False
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if not isinstance(value, (int, float)): return False
+                if op == "$gt" and not value > target: return False
+                if op == "$gte" and not value >= target: return False
+                if op == "$lt" and not value < target: return False
+                if op == "$lte" and not value <= target: return False
+    return True
+
+
+class InMemoryVectorIndex:
+    """
+    Small local stand-in for a Pinecone index (same upsert/query shapes).
+    Filters are applied in memory BEFORE the top-k cut, like Pinecone does server-side.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.vectors = None
+
+    def upsert(self, vectors):
+        """Accepts [(id, values, metadata), ...] like pinecone.Index.upsert."""
+        rows = []
+        for item_id, values, meta in vectors:
+            v = np.asarray(values, dtype=np.float32)
+            norm = np.linalg.norm(v)
+            rows.append(v / norm if norm else v)
+            self.ids.append(item_id)
+            self.metadata.append(meta or {})
+        new = np.vstack(rows)
+        self.vectors = new if self.vectors is None else np.vstack([self.vectors, new])
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = True, filter: Dict[str, Any] = None):
+        if self.vectors is None:
+            return {"matches": []}
+
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        candidates = np.array([i for i, meta in enumerate(self.metadata) if matches_filter(meta, filter)], dtype=int)
+        if candidates.size == 0:
+            return {"matches": []}
+
+        scores = self.vectors[candidates] @ q
+        k = min(top_k, candidates.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for j in top:
+            i = candidates[j]
+            match = {"id": self.ids[i], "score": float(scores[j])}
+            if include_metadata:
+                match["metadata"] = self.metadata[i]
+            matches.append(match)
+        return {"matches": matches}
@@ -0,0 +1,460 @@
+### Offline benchmark for the hybrid retrieval engines.
+### 1. RECORD: run a golden question set against the live services and save every Pinecone / Neo4j / LLM / embedding
+###    response (plus its latency) into a fixture file.
+### 2. REPLAY: run the same questions against the fixtures only, with an injectable latency model, and report
+###    p50/p95 latency (end-to-end + per stage), recall of expected cases/policies and token usage.
+###
+### Usage:
+###   python retrieval_benchmark.py record golden.json fixtures.json --engine policy
+###   python retrieval_benchmark.py replay golden.json fixtures.json --latency recorded --report new.json --compare old.json
+###
+### golden.json: [{"question": "...", "expected_cases": ["..."], "expected_policies": ["..."]}, ...]
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from typing import List, Dict, Any
+from langchain_core.messages import AIMessage
+
+logger = logging.getLogger(__name__)
+
+
+class FixtureMiss(KeyError):
+    pass
+
+
+class FixtureStore:
+    """Recorded responses, keyed by a hash of the request. Kinds: embed, vector, graph, llm."""
+
+    KINDS = ("embed", "vector", "graph", "llm")
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self.data = {"meta": {}, **{kind: {} for kind in self.KINDS}}
+        self.misses = {kind: 0 for kind in self.KINDS}
+        if os.path.exists(filepath):
+            with open(filepath, "r", encoding="utf-8") as f:
+                self.data.update(json.load(f))
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def put(self, kind: str, key: str, value, latency_s: float):
+        with self._lock:
+            self.data[kind][key] = {"value": value, "latency_s": round(latency_s, 6)}
+
+    def get(self, kind: str, key: str):
+        entry = self.data[kind].get(key)
+        if entry is None:
+            with self._lock:
+                self.misses[kind] += 1
+            raise FixtureMiss(f"No recorded {kind} response for key {key}")
+        return entry
+
+    def save(self):
+        tmp_path = f"{self.filepath}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.filepath)
+        sizes = {kind: len(self.data[kind]) for kind in self.KINDS}
+        logger.info(f"💾 Saved fixtures to {self.filepath}: {sizes}")
+
+
+def _vector_key(vector, top_k, metadata_filter):
+    return FixtureStore.key([round(float(x), 6) for x in vector], top_k, metadata_filter)
+
+def _graph_key(cypher, params):
+    return FixtureStore.key(" ".join(cypher.split()), params)
+
+def _llm_key(messages):
+    return FixtureStore.key([(m.type, str(m.content)) for m in messages])
+
+
+# =======================================================
+# ⏳ LATENCY MODELS (kind, recorded entry) -> seconds to sleep
+# =======================================================
+class NoLatency:
+    def __call__(self, kind, entry):
+        return 0.0
+
+class RecordedLatency:
+    """Replays the latency measured while recording (optionally scaled)."""
+    def __init__(self, scale: float = 1.0):
+        self.scale = scale
+
+    def __call__(self, kind, entry):
+        return entry.get("latency_s", 0.0) * self.scale
+
+class ConstantLatency:
+    def __init__(self, seconds_per_kind: Dict[str, float]):
+        self.seconds_per_kind = seconds_per_kind
+
+    def __call__(self, kind, entry):
+        return self.seconds_per_kind.get(kind, 0.0)
+
+class LogNormalLatency:
+    """Seeded log-normal latency around a median per kind (same seed -> same run)."""
+    def __init__(self, median_per_kind: Dict[str, float], sigma: float = 0.35, seed: int = 42):
+        self.median_per_kind = median_per_kind
+        self.sigma = sigma
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, entry):
+        median = self.median_per_kind.get(kind, 0.0)
+        with self._lock:
+            return median * self.rng.lognormvariate(0, self.sigma) if median else 0.0
+
+LATENCY_MODELS = {
+    "none": lambda: NoLatency(),
+    "recorded": lambda: RecordedLatency(),
+    "constant": lambda: ConstantLatency({"embed": 0.05, "vector": 0.08, "graph": 0.04, "llm": 1.5}),
+    "lognormal": lambda: LogNormalLatency({"embed": 0.05, "vector": 0.08, "graph": 0.04, "llm": 1.5}),
+}
+
+
+# =======================================================
+# 🎙️ RECORDING WRAPPERS (around the live clients)
+# =======================================================
+class RecordingEmbedder:
+    def __init__(self, inner, store: FixtureStore):
+        self.inner, self.store = inner, store
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        vector = list(self.inner.embed_query(text))
+        self.store.put("embed", FixtureStore.key(text), vector, time.perf_counter() - start)
+        return vector
+
+    def embed_documents(self, texts, **kwargs):
+        start = time.perf_counter()
+        vectors = [list(v) for v in self.inner.embed_documents(texts, **kwargs)]
+        share = (time.perf_counter() - start) / max(1, len(texts))
+        for text, vector in zip(texts, vectors):
+            self.store.put("embed", FixtureStore.key(text), vector, share)
+        return vectors
+
+class RecordingIndex:
+    def __init__(self, inner, store: FixtureStore):
+        self.inner, self.store = inner, store
+
+    def query(self, vector, top_k=5, include_metadata=True, filter=None):
+        start = time.perf_counter()
+        kwargs = {"vector": vector, "top_k": top_k, "include_metadata": include_metadata}
+        if filter:
+            kwargs["filter"] = filter
+        results = self.inner.query(**kwargs)
+        matches = [
+            {"id": m["id"], "score": float(m["score"]), "metadata": dict(m["metadata"] or {})}
+            for m in results["matches"]
+        ]
+        self.store.put("vector", _vector_key(vector, top_k, filter), matches, time.perf_counter() - start)
+        return {"matches": matches}
+
+class FixtureResult(list):
+    """List of record dicts that also answers .single() like a neo4j Result."""
+    def single(self):
+        return self[0] if self else None
+
+    def data(self):
+        return list(self)
+
+class RecordingSession:
+    def __init__(self, inner, store: FixtureStore):
+        self.inner, self.store = inner, store
+
+    def __enter__(self):
+        self.inner.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.inner.__exit__(*exc)
+
+    def execute_read(self, fn, *args, **kwargs):
+        return self.inner.execute_read(lambda tx, *a, **kw: fn(RecordingTx(tx, self.store), *a, **kw), *args, **kwargs)
+
+class RecordingTx:
+    def __init__(self, inner, store: FixtureStore):
+        self.inner, self.store = inner, store
+
+    def run(self, cypher, **params):
+        start = time.perf_counter()
+        records = [r.data() for r in self.inner.run(cypher, **params)]
+        self.store.put("graph", _graph_key(cypher, params), records, time.perf_counter() - start)
+        return FixtureResult(records)
+
+class RecordingDriver:
+    def __init__(self, inner, store: FixtureStore):
+        self.inner, self.store = inner, store
+
+    def session(self, **kwargs):
+        return RecordingSession(self.inner.session(**kwargs), self.store)
+
+    def verify_connectivity(self):
+        return self.inner.verify_connectivity()
+
+    def close(self):
+        self.inner.close()
+
+class RecordingLLM:
+    def __init__(self, inner, store: FixtureStore):
+        self.inner, self.store = inner, store
+
+    def invoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        message = self.inner.invoke(messages, **kwargs)
+        value = {"content": message.content, "usage": dict(getattr(message, "usage_metadata", None) or {})}
+        self.store.put("llm", _llm_key(messages), value, time.perf_counter() - start)
+        return message
+
+
+# =======================================================
+# 📼 REPLAY FAKES (no network)
+# =======================================================
+class _Replay:
+    def __init__(self, store: FixtureStore, latency_model, strict: bool = False):
+        self.store, self.latency_model, self.strict = store, latency_model, strict
+
+    def _fetch(self, kind, key, default):
+        try:
+            entry = self.store.get(kind, key)
+        except FixtureMiss:
+            if self.strict:
+                raise
+            logger.warning(f"⚠️ Fixture miss ({kind}). Re-record if the engine's requests changed.")
+            return default
+        delay = self.latency_model(kind, entry)
+        if delay > 0:
+            time.sleep(delay)
+        return entry["value"]
+
+class FixtureEmbedder(_Replay):
+    def embed_query(self, text):
+        # A question without a recorded embedding cannot be faked, so this always fails loudly
+        entry = self.store.get("embed", FixtureStore.key(text))
+        delay = self.latency_model("embed", entry)
+        if delay > 0:
+            time.sleep(delay)
+        return entry["value"]
+
+    def embed_documents(self, texts, **kwargs):
+        return [self.embed_query(text) for text in texts]
+
+class FixtureIndex(_Replay):
+    def query(self, vector, top_k=5, include_metadata=True, filter=None):
+        return {"matches": self._fetch("vector", _vector_key(vector, top_k, filter), [])}
+
+class FixtureSession(_Replay):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, fn, *args, **kwargs):
+        # The session doubles as the transaction
+        return fn(self, *args, **kwargs)
+
+    def run(self, cypher, **params):
+        return FixtureResult(self._fetch("graph", _graph_key(cypher, params), []))
+
+class FixtureDriver(_Replay):
+    def session(self, **kwargs):
+        return FixtureSession(self.store, self.latency_model, self.strict)
+
+    def verify_connectivity(self):
+        return None
+
+    def close(self):
+        return None
+
+class FixtureLLM(_Replay):
+    def __init__(self, store, latency_model, strict=False):
+        super().__init__(store, latency_model, strict)
+        self.model = store.data["meta"].get("llm_model_name", "fixture")
+
+    def invoke(self, messages, **kwargs):
+        value = self._fetch("llm", _llm_key(messages), {"content": "", "usage": {}})
+        usage = value.get("usage") or None
+        if usage and "total_tokens" not in usage:
+            usage["total_tokens"] = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+        return AIMessage(content=value["content"], usage_metadata=usage) if usage else AIMessage(content=value["content"])
+
+
+# =======================================================
+# 📊 BENCHMARK
+# =======================================================
+def percentile(values: List[float], q: float):
+    """Nearest-rank percentile (q in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def _recall(expected: List[str], found_text: str):
+    if not expected:
+        return None
+    found_text = found_text.lower()
+    return sum(1 for name in expected if name.lower() in found_text) / len(expected)
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 4) if values else None
+
+def load_golden_set(filepath: str) -> List[Dict[str, Any]]:
+    with open(filepath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def run_benchmark(engine, golden: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Runs every golden question through engine.ask_detailed and aggregates latency, recall and tokens."""
+    per_question = []
+    for item in golden:
+        question = item["question"]
+        try:
+            result = engine.ask_detailed(question)
+        except Exception as e:
+            logger.error(f"❌ '{question[:60]}' failed: {e}")
+            per_question.append({"question": question, "error": str(e)})
+            continue
+
+        sources_text = " | ".join(result["sources"])
+        per_question.append({
+            "question": question,
+            "timings": result["timings"],
+            "tokens": result["tokens"],
+            "context_recall_cases": _recall(item.get("expected_cases", []), sources_text),
+            "context_recall_policies": _recall(item.get("expected_policies", []), sources_text),
+            "answer_recall": _recall(item.get("expected_cases", []) + item.get("expected_policies", []), result["answer"] or ""),
+        })
+
+    ok = [q for q in per_question if "error" not in q]
+    stages = sorted({stage for q in ok for stage in q["timings"]})
+    report = {
+        "questions": len(golden),
+        "errors": len(per_question) - len(ok),
+        "latency_s": {
+            stage: {
+                "p50": percentile([q["timings"][stage] for q in ok if stage in q["timings"]], 50),
+                "p95": percentile([q["timings"][stage] for q in ok if stage in q["timings"]], 95),
+            } for stage in stages
+        },
+        "recall": {
+            "context_cases": _mean([q["context_recall_cases"] for q in ok]),
+            "context_policies": _mean([q["context_recall_policies"] for q in ok]),
+            "answer": _mean([q["answer_recall"] for q in ok]),
+        },
+        "tokens": {
+            "sent": sum(t["sent"] for q in ok for t in q["tokens"].values()),
+            "received": sum(t["received"] for q in ok for t in q["tokens"].values()),
+        },
+        "per_question": per_question,
+    }
+    return report
+
+def print_report(report: Dict[str, Any], baseline: Dict[str, Any] = None):
+    def delta(new, old):
+        if baseline is None or new is None or old is None: return ""
+        return f"  ({new - old:+.3f})"
+
+    base_latency = (baseline or {}).get("latency_s", {})
+    print(f"\n================ BENCHMARK ({report['questions']} questions, {report['errors']} errors) ================")
+    print(f"{'stage':<20}{'p50 (s)':>12}{'p95 (s)':>12}")
+    for stage, q in report["latency_s"].items():
+        old = base_latency.get(stage, {})
+        print(f"{stage:<20}{q['p50']:>12.3f}{q['p95']:>12.3f}{delta(q['p95'], old.get('p95'))}")
+    print("\nRecall:")
+    for name, value in report["recall"].items():
+        print(f"  {name:<18} {value}{delta(value, (baseline or {}).get('recall', {}).get(name))}")
+    print(f"\nTokens: sent={report['tokens']['sent']} received={report['tokens']['received']}"
+          f"{delta(report['tokens']['sent'], (baseline or {}).get('tokens', {}).get('sent'))}")
+    if report.get("fixture_misses"):
+        print(f"Fixture misses: {report['fixture_misses']}")
+    print("==========================================")
+
+
+if __name__ == "__main__":
+    from batch_ask import ENGINES, PINECONE_KEY, PINECONE_INDEX, NEO4J_URI, NEO4J_AUTH, GOOGLE_KEY, EMBEDDING_TYPE
+
+    parser = argparse.ArgumentParser(description="Offline benchmark for the Hybrid Retrieval Engine")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("golden", help="JSON golden question set")
+    parser.add_argument("fixtures", help="Fixture file to write (record) or read (replay)")
+    parser.add_argument("--engine", choices=ENGINES.keys(), default="policy")
+    parser.add_argument("--ollama", action="store_true", help="Record with local Ollama instead of Gemini")
+    parser.add_argument("--latency", choices=LATENCY_MODELS.keys(), default="recorded", help="Replay latency model")
+    parser.add_argument("--strict", action="store_true", help="Fail on any fixture miss instead of returning empty results")
+    parser.add_argument("--report", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report to diff against")
+    args = parser.parse_args()
+
+    golden = load_golden_set(args.golden)
+    store = FixtureStore(args.fixtures)
+    engine_class = ENGINES[args.engine]
+
+    if args.mode == "record":
+        engine = engine_class(
+            pinecone_api_key=PINECONE_KEY,
+            pinecone_index_name=PINECONE_INDEX,
+            neo4j_uri=NEO4J_URI,
+            neo4j_auth=NEO4J_AUTH,
+            google_api_key=GOOGLE_KEY,
+            use_ollama=args.ollama,
+            embedding_model_type=EMBEDDING_TYPE
+        )
+        engine.embedder = RecordingEmbedder(engine.embedder, store)
+        engine.index = RecordingIndex(engine.index, store)
+        engine.driver = RecordingDriver(engine.driver, store)
+        # The stage routes hold their own references to the LLM clients, so wrap those too
+        wrapped = {}
+        def _record(llm):
+            return wrapped.setdefault(id(llm), RecordingLLM(llm, store))
+        for route in engine.stage_llms.values():
+            while route is not None:
+                route["llm"] = _record(route["llm"])
+                route = route["fallback"]
+        engine.llm = _record(engine.llm)
+        store.data["meta"] = {
+            "engine": args.engine,
+            "embedding_type": EMBEDDING_TYPE,
+            "llm_model_name": engine.llm_model_name,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+    else:
+        latency_model = LATENCY_MODELS[args.latency]()
+        meta = store.data["meta"]
+        engine = engine_class(
+            pinecone_api_key=None,
+            pinecone_index_name=None,
+            neo4j_uri=None,
+            neo4j_auth=None,
+            embedding_model_type=meta.get("embedding_type", EMBEDDING_TYPE),
+            llm=FixtureLLM(store, latency_model, args.strict),
+            embedder=FixtureEmbedder(store, latency_model, args.strict),
+            vector_index=FixtureIndex(store, latency_model, args.strict),
+            neo4j_driver=FixtureDriver(store, latency_model, args.strict)
+        )
+
+    report = run_benchmark(engine, golden)
+    if args.mode == "record":
+        store.save()
+    else:
+        report["fixture_misses"] = {k: v for k, v in store.misses.items() if v}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.report}")
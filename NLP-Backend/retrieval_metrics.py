@@ -0,0 +1,208 @@
+### Stage timing, latency histograms and LLM token counters for the retrieval engines.
+### Export as Prometheus text (scrape or node-exporter textfile) or as periodic JSON log lines.
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds. Covers a local MiniLM embedding (~ms) up to a slow Gemini synthesis (~tens of s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class LatencyHistogram:
+    """Cumulative histogram with fixed upper bounds (Prometheus semantics)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bucket bound containing the q-quantile (coarse, like histogram_quantile)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        for bound, c in zip(self.buckets, self.counts):
+            if c >= target:
+                return bound
+        return float("inf")
+
+
+def _escape(value) -> str:
+    """Label value as the exposition format wants it: backslash, double quote and newline escaped."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store for stage latencies, LLM token counts and gauges (e.g. Neo4j pool usage).
+    One registry can be shared by several engines (the 'engine' label tells them apart).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple, LatencyHistogram] = {}
+        self._counters: Dict[Tuple, float] = {}
+        self._gauges: Dict[Tuple, float] = {}
+        self._json_thread = None
+        self._json_stop = threading.Event()
+
+    def observe(self, stage: str, seconds: float, engine: str = "", model: str = ""):
+        key = (("engine", engine), ("model", model), ("stage", stage)) if model else (("engine", engine), ("stage", stage))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = LatencyHistogram(self.buckets)
+            hist.observe(seconds)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def add_tokens(self, stage: str, sent: int, received: int, engine: str = "", model: str = ""):
+        """Counts one LLM call and the tokens sent (prompt) and received (completion)."""
+        self.inc("retrieval_llm_calls_total", 1, engine=engine, stage=stage, model=model)
+        self.inc("retrieval_llm_tokens_total", sent, engine=engine, stage=stage, model=model, direction="sent")
+        self.inc("retrieval_llm_tokens_total", received, engine=engine, stage=stage, model=model, direction="received")
+
+    # --- EXPORT ---
+    def to_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP retrieval_stage_seconds Latency of retrieval engine stages.",
+            "# TYPE retrieval_stage_seconds histogram",
+        ]
+        with self._lock:
+            for labels, hist in sorted(self._histograms.items()):
+                for bound, c in zip(hist.buckets, hist.counts):
+                    le = 'le="%s"' % bound
+                    lines.append(f"retrieval_stage_seconds_bucket{_labels(labels, le)} {c}")
+                le = 'le="+Inf"'
+                lines.append(f"retrieval_stage_seconds_bucket{_labels(labels, le)} {hist.count}")
+                lines.append(f"retrieval_stage_seconds_sum{_labels(labels)} {hist.sum:.6f}")
+                lines.append(f"retrieval_stage_seconds_count{_labels(labels)} {hist.count}")
+
+            declared = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in declared:
+                    lines.append(f"# TYPE {name} counter")
+                    declared.add(name)
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+
+            for (name, labels), value in sorted(self._gauges.items()):
+                if name not in declared:
+                    lines.append(f"# TYPE {name} gauge")
+                    declared.add(name)
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filepath: str):
+        """Atomically writes the Prometheus text to a file (node-exporter textfile collector)."""
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, filepath)
+
+    def snapshot(self) -> Dict:
+        """JSON-friendly summary: count, mean, p50/p95 per stage plus all counters and gauges."""
+        with self._lock:
+            stages = {}
+            for labels, hist in self._histograms.items():
+                name = "/".join(v for _, v in labels if v)
+                stages[name] = {
+                    "count": hist.count,
+                    "mean_s": round(hist.sum / hist.count, 4) if hist.count else None,
+                    "p50_s": hist.quantile(0.5),
+                    "p95_s": hist.quantile(0.95),
+                }
+            counters = {
+                name + _labels(labels): value for (name, labels), value in self._counters.items()
+            }
+            gauges = {
+                name + _labels(labels): value for (name, labels), value in self._gauges.items()
+            }
+        return {"stages": stages, "counters": counters, "gauges": gauges}
+
+    def start_json_logging(self, interval_seconds: float = 60.0):
+        """Logs a JSON snapshot every interval on a daemon thread."""
+        if self._json_thread and self._json_thread.is_alive():
+            return
+
+        def _loop():
+            while not self._json_stop.wait(interval_seconds):
+                logger.info(f"📊 metrics {json.dumps(self.snapshot())}")
+
+        self._json_stop.clear()
+        self._json_thread = threading.Thread(target=_loop, name="metrics-json-logger", daemon=True)
+        self._json_thread.start()
+
+    def stop_json_logging(self):
+        self._json_stop.set()
+
+
+class StageTimer:
+    """
+    Times the stages of one request with a monotonic clock (time.perf_counter).
+    Every stage is stored in .timings and observed in the registry.
+    """
+
+    def __init__(self, metrics: MetricsRegistry = None, engine: str = ""):
+        self.metrics = metrics
+        self.engine = engine
+        self.timings: Dict[str, float] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self.models: Dict[str, str] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        if self.metrics is not None:
+            self.metrics.observe(name, seconds, engine=self.engine)
+
+    def add_tokens(self, stage: str, sent: int, received: int):
+        entry = self.tokens.setdefault(stage, {"sent": 0, "received": 0})
+        entry["sent"] += sent
+        entry["received"] += received
+
+    def finish(self, total: float = None) -> Dict[str, float]:
+        """
+        Records the 'total' stage and returns the breakdown.
+        total defaults to wall time since the timer was created.
+        """
+        self.add("total", time.perf_counter() - self._start if total is None else total)
+        return self.timings
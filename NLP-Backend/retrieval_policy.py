@@ -1,17 +1,7 @@
 import os
 import logging
 from typing import List, Dict, Any
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_community.chat_models import ChatOllama
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
-from neo4j import GraphDatabase
-import google.generativeai as genai
-import json
-import os
+from hybrid_retrieval_engine import HybridRetrievalEngine
 from dotenv import load_dotenv
 
 
@@ -21,183 +11,69 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class HybridRetrievalEngine:
-    def __init__(
-        self, 
-        pinecone_api_key: str,
-        pinecone_index_name: str,
-        neo4j_uri: str,
-        neo4j_auth: tuple,
-        google_api_key: str = None,
-        use_ollama: bool = False,
-        ollama_model: str = "llama3",
-        embedding_model_type: str = "minilm" # 'google' or 'minilm' (MUST match what you used for ingestion!)
-    ):
-        """
-        Args:
-            embedding_model_type: MUST match the model used in knowledge_graph_builder.py 
-                                  ('minilm' = 384 dims, 'google' = 768 dims)
-        """
-        self.use_ollama = use_ollama
-        self.embedding_type = embedding_model_type
-        
-        # --- 1. SETUP LLM (The Reasoning Brain) ---
-        if self.use_ollama:
-            logger.info(f"🤖 Using Ollama ({ollama_model}) for reasoning...")
-            self.llm = ChatOllama(model=ollama_model, temperature=0)
-        else:
-            if not google_api_key:
-                raise ValueError("Google API Key required for Gemini.")
-            logger.info("✨ Using Google Gemini 2.5 Flash for reasoning...")
-            # Note: 'gemini-2.0-flash-exp' is the preview name, falling back to 1.5-flash if 2.0 not avail in your region
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash", 
-                google_api_key=google_api_key,
-                temperature=0
-            )
-
-        # --- 2. SETUP EMBEDDINGS (For Vector Search) ---
-        # CRITICAL: This must match the dimension of your Pinecone index (384 or 768)
-        if self.embedding_type == "google":
-            if not google_api_key: raise ValueError("Google API Key required for embeddings.")
-            self.embedder = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=google_api_key)
-            self.embedding_dim = 768
-        else:
-            # We use raw SentenceTransformer here to ensure exact match with builder script
-            self.local_embedder = SentenceTransformer('all-MiniLM-L6-v2')
-            self.embedding_dim = 384
-
-        # --- 3. CONNECT TO DATABASES ---
-        # Pinecone
-        self.pc = Pinecone(api_key=pinecone_api_key)
-        self.index = self.pc.Index(pinecone_index_name)
-        
-        # Neo4j
-        self.driver = GraphDatabase.driver(neo4j_uri, auth=neo4j_auth)
-        self.driver.verify_connectivity()
-        logger.info("✅ Connected to Pinecone and Neo4j.")
-
-    def _get_query_embedding(self, text: str) -> List[float]:
-        """Helper to get embedding based on selected model."""
-        if self.embedding_type == "google":
-            return self.embedder.embed_query(text)
-        else:
-            return self.local_embedder.encode(text).tolist()
+class PolicyAwareRetrievalEngine(HybridRetrievalEngine):
+    """
+    Hybrid engine for the mixed Case + Policy index.
+    Connections, embeddings, batching and orchestration come from HybridRetrievalEngine;
+    this class only changes how Policies are formatted, queried in the graph and synthesized.
+    """
 
     # =======================================================
     # 🧠 LEG 1: VECTOR SEARCH (Pinecone)
     # =======================================================
-    def query_vector_store(self, query: str, top_k: int = 5) -> str:
-        """
-        Searches Pinecone for semantically similar case descriptions.
-        Returns a single string of context.
-        """
-        logger.info(f"🔍 Vector Search for: '{query}'")
-        vector = self._get_query_embedding(query)
-        
-        results = self.index.query(
-            vector=vector,
-            top_k=top_k,
-            include_metadata=True
-        )
-        
-        context_pieces = []
-        for match in results['matches']:
-            meta = match['metadata']
-            score = match['score']
-            doc_type = meta.get('type', 'Case') # Default to 'Case' if missing
-            
-            if doc_type == 'Policy':
-                # Format for Policies
-                piece = f"[POLICY: {meta.get('title', 'Unknown')} ({meta.get('year', 'N/A')})] (Jurisdiction: {meta.get('jurisdiction', 'Global')}) (Score: {score:.2f})\nSUMMARY: {meta.get('text', '')}\n"
-            else:
-                # Format for Litigation Cases
-                piece = f"[CASE: {meta.get('case_name', 'Unknown')} ({meta.get('year', 'N/A')})] (Jurisdiction: {meta.get('jurisdiction', 'Unknown')}) (Score: {score:.2f})\nDESC: {meta.get('text', '')}\n"
-            
-            context_pieces.append(piece)
-            
-        return "\n".join(context_pieces)
+    def _format_match(self, match) -> str:
+        meta = match['metadata']
+        score = match['score']
+        doc_type = meta.get('type', 'Case') # Default to 'Case' if missing
+        
+        if doc_type == 'Policy':
+            # Format for Policies
+            return f"[POLICY: {meta.get('title', 'Unknown')} ({meta.get('year', 'N/A')})] (Jurisdiction: {meta.get('jurisdiction', 'Global')}) (Score: {score:.2f})\nSUMMARY: {meta.get('text', '')}\n"
+        else:
+            # Format for Litigation Cases
+            return f"[CASE: {meta.get('case_name', 'Unknown')} ({meta.get('year', 'N/A')})] (Jurisdiction: {meta.get('jurisdiction', 'Unknown')}) (Score: {score:.2f})\nDESC: {meta.get('text', '')}\n"
 
     # =======================================================
     # 🕸️ LEG 2: GRAPH SEARCH (Neo4j)
     # =======================================================
-    def extract_entities_for_graph(self, query: str) -> List[str]:
-        """
-        Uses the LLM to figure out which Entities (Companies, Pollutants, etc.) 
-        are in the user's question so we can query the Graph.
-        """
-        prompt = ChatPromptTemplate.from_template("""
-        Extract the key named entities from this user query that would likely exist in a climate litigation database.
-        Focus on: Companies, Jurisdictions (Countries/Cities), Specific Laws, Pollutants, or Harms.
-        
-        Query: "{query}"
-        
-        Return ONLY a comma-separated list of names. If none, return "NONE".
-        Example Output: Shell, Nigeria, Carbon Dioxide
-        """)
-        
-        chain = prompt | self.llm | StrOutputParser()
-        response = chain.invoke({"query": query})
-        
-        if "NONE" in response: return []
-        return [x.strip() for x in response.split(",")]
+    def _lookup_entity(self, tx, entity: str) -> List[Dict[str, Any]]:
+        context_lines = []
 
-    def query_graph_db(self, entities: List[str]) -> str:
+        # 1. Find Cases
+        cypher_cases = """
+        MATCH (e {name: $name})<-[:MENTIONS]-(c:CourtCase)
+        RETURN e.name as Entity, [l IN labels(e) WHERE l <> 'Entity'] as Type, c.name as Case, c.year as Year
+        LIMIT 3
         """
-        Queries Neo4j for facts connected to the extracted entities.
+        result_c = tx.run(cypher_cases, name=entity)
+        for r in result_c:
+            context_lines.append({"text": f"- Entity '{r['Entity']}' is involved in CASE '{r['Case']}' ({r['Year']}).", "doc": r['Case']})
+
+        # 2. Find Policies (The Rules) - NEW!
+        # Finds policies that REGULATE a Sector or ADDRESS a Pollutant/Harm
+        cypher_policies = """
+        MATCH (e {name: $name})<-[r]-(p:Policy)
+        RETURN e.name as Entity, type(r) as Relation, p.title as Policy, p.date as Date
+        LIMIT 3
         """
-        if not entities:
-            return "No specific entities identified for Graph Search."
-            
-        logger.info(f"🕸️ Graph Search for entities: {entities}")
-        
-        context_lines = []
-        with self.driver.session() as session:
-            for entity in entities:
-                # 1. Find Cases
-                cypher_cases = """
-                MATCH (e {name: $name})<-[:MENTIONS]-(c:CourtCase)
-                RETURN e.name as Entity, labels(e) as Type, c.name as Case, c.year as Year
-                LIMIT 3
-                """
-                result_c = session.run(cypher_cases, name=entity)
-                for r in result_c:
-                    context_lines.append(f"- Entity '{r['Entity']}' is involved in CASE '{r['Case']}' ({r['Year']}).")
+        result_p = tx.run(cypher_policies, name=entity)
+        for r in result_p:
+            context_lines.append({"text": f"- Entity '{r['Entity']}' is {r['Relation']} by POLICY '{r['Policy']}' ({r['Date']}).", "doc": r['Policy']})
 
-                # 2. Find Policies (The Rules) - NEW!
-                # Finds policies that REGULATE a Sector or ADDRESS a Pollutant/Harm
-                cypher_policies = """
-                MATCH (e {name: $name})<-[r]-(p:Policy)
-                RETURN e.name as Entity, type(r) as Relation, p.title as Policy, p.date as Date
-                LIMIT 3
-                """
-                result_p = session.run(cypher_policies, name=entity)
-                for r in result_p:
-                    context_lines.append(f"- Entity '{r['Entity']}' is {r['Relation']} by POLICY '{r['Policy']}' ({r['Date']}).")
+        return context_lines
 
-        return "\n".join(context_lines) if context_lines else "No direct graph connections found."
+    def _facts_from_neighbourhood(self, entity: str, neighbourhood: Dict[str, Any]) -> List[Dict[str, Any]]:
+        context_lines = []
+        for c in neighbourhood["cases"][:3]:
+            context_lines.append({"text": f"- Entity '{neighbourhood['name']}' is involved in CASE '{c['case']}' ({c['year']}).", "doc": c['case']})
+        for p in neighbourhood["policies"][:3]:
+            context_lines.append({"text": f"- Entity '{neighbourhood['name']}' is {p['relation']} by POLICY '{p['policy']}' ({p['date']}).", "doc": p['policy']})
+        return context_lines
 
     # =======================================================
     # 🚀 HYBRID ORCHESTRATOR
     # =======================================================
-    def ask(self, query: str) -> str:
-        """
-        The main entry point.
-        1. Get Vector Context
-        2. Get Graph Context
-        3. Synthesize Answer via LLM
-        """
-        print(f"\n🤔 USER ASKS: {query}")
-        
-        # 1. Parallel Retrieval (Conceptually)
-        vector_context = self.query_vector_store(query)
-        
-        # 2. Entity Extraction & Graph Query
-        entities = self.extract_entities_for_graph(query)
-        graph_context = self.query_graph_db(entities)
-        
-        # 3. Synthesis Prompt
-        final_prompt = ChatPromptTemplate.from_template("""
+    SYNTHESIS_TEMPLATE = """
         You are a Strategic Climate Accountability Analyst.
         Your goal is to identify gaps between "The Rules" (Policies) and "The Reality" (Litigation).
         
@@ -217,18 +93,7 @@ class HybridRetrievalEngine:
         4. Provide actionable insights for an investigator or activist.
         
         Answer:
-        """)
-        
-        chain = final_prompt | self.llm | StrOutputParser()
-        
-        print("⚡ Generating Hybrid Response...")
-        response = chain.invoke({
-            "query": query,
-            "vector_context": vector_context,
-            "graph_context": graph_context
-        })
-        
-        return response
+        """
 
 # ==========================================
 # EXECUTION BLOCK
@@ -249,7 +114,7 @@ if __name__ == "__main__":
     USE_OLLAMA = False # Set True to use local Llama3
     
     try:
-        engine = HybridRetrievalEngine(
+        engine = PolicyAwareRetrievalEngine(
             pinecone_api_key=PINECONE_KEY,
             pinecone_index_name=PINECONE_INDEX,
             neo4j_uri=NEO4J_URI,
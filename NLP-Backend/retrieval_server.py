@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+HTTP service around the hybrid + policy-aware retrieval engines.
+Clients (Pinecone, Neo4j, embedding model, LLM) are created once at startup and shared by both engines.
+
+Usage:
+    python retrieval_server.py --port 8090 --max-concurrent 8
+
+Endpoints:
+    POST /query   {"query": "...", "engine": "policy", "top_k": 5}
+    POST /batch   {"queries": ["...", "..."], "engine": "hybrid", "concurrency": 4}
+    POST /stream  {"query": "..."}  -> text/event-stream (context, token..., done)
+    GET  /health  process is up
+    GET  /ready   200 once the engines are built and warmed up, 503 before
+    GET  /metrics Prometheus text
+"""
+
+from flask import Flask, request, jsonify, Response, stream_with_context
+from flask_cors import CORS
+import json
+import time
+import queue
+import argparse
+import threading
+import traceback
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from batch_ask import PINECONE_KEY, PINECONE_INDEX, NEO4J_URI, NEO4J_AUTH, GOOGLE_KEY, EMBEDDING_TYPE, ENGINES
+from graph_snapshot import GraphSnapshot
+from retrieval_metrics import MetricsRegistry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+CORS(app)
+
+# Defaults, overridden from the command line
+MAX_CONCURRENT = 8        # questions answered at the same time (a batch counts once)
+QUEUE_TIMEOUT = 5.0       # seconds a request may wait for a free slot before getting 429
+REQUEST_TIMEOUT = 120.0   # seconds before /query and /batch give up with 504 (and /stream with an error event)
+MAX_BATCH = 50
+
+# Global state, filled in by warm_up()
+engines = {}
+metrics = MetricsRegistry()
+state = {"ready": False, "error": None, "started_at": datetime.now().isoformat(), "ready_at": None}
+slots = threading.BoundedSemaphore(MAX_CONCURRENT)
+workers = ThreadPoolExecutor(max_workers=MAX_CONCURRENT, thread_name_prefix="engine")
+
+
+def warm_up(use_ollama=False, graph_snapshot=None):
+    """Builds both engines on one set of clients and runs every stage once, so the first request is not slow."""
+    try:
+        start = time.perf_counter()
+        logger.info("🚀 Building retrieval engines...")
+        base = ENGINES["hybrid"](
+            pinecone_api_key=PINECONE_KEY,
+            pinecone_index_name=PINECONE_INDEX,
+            neo4j_uri=NEO4J_URI,
+            neo4j_auth=NEO4J_AUTH,
+            google_api_key=GOOGLE_KEY,
+            use_ollama=use_ollama,
+            embedding_model_type=EMBEDDING_TYPE,
+            metrics=metrics,
+            graph_snapshot=GraphSnapshot(graph_snapshot) if graph_snapshot else None
+        )
+        engines["hybrid"] = base
+        engines["policy"] = ENGINES["policy"](
+            pinecone_api_key=None,
+            pinecone_index_name=None,
+            neo4j_uri=None,
+            neo4j_auth=None,
+            embedding_model_type=EMBEDDING_TYPE,
+            metrics=metrics,
+            llm=base.llm,
+            embedder=base.embedder,
+            vector_index=base.index,
+            neo4j_driver=base.driver,
+            graph_snapshot=base.graph_snapshot
+        )
+
+        # Touch every client once: loads the embedding model, opens pool connections, fills DNS/TLS caches
+        logger.info("🔥 Warming up...")
+        vector = base._get_query_embedding("climate litigation")
+        base.search_vectors("climate litigation", top_k=1, vector=vector)
+        base._fetch_graph_facts(["Shell"])
+        if use_ollama:
+            # Ollama loads the model into memory on the first call
+            base.extract_entities_for_graph("Which cases involve Shell?")
+
+        state["ready"] = True
+        state["ready_at"] = datetime.now().isoformat()
+        logger.info(f"✅ Engines ready in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        state["error"] = str(e)
+        logger.error(f"❌ Warmup failed: {e}")
+        logger.error(traceback.format_exc())
+
+
+def _parse_request():
+    """Returns (data, engine, error response or None)."""
+    data = request.get_json(silent=True) or {}
+    name = data.get("engine", "policy")
+    if not state["ready"]:
+        return data, None, (jsonify({"error": "Engines are still warming up"}), 503)
+    if name not in engines:
+        return data, None, (jsonify({"error": f"Unknown engine '{name}' (use {', '.join(engines)})"}), 400)
+    return data, engines[name], None
+
+
+def _run_limited(fn, *args):
+    """
+    Runs fn on the worker pool if a concurrency slot frees up within QUEUE_TIMEOUT.
+    The slot is held until fn really finishes, even if the request already timed out.
+    """
+    if not slots.acquire(timeout=QUEUE_TIMEOUT):
+        metrics.inc("server_rejected_total", reason="busy")
+        return None, (jsonify({"error": "Server busy, try again later"}), 429)
+    future = workers.submit(fn, *args)
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=REQUEST_TIMEOUT), None
+    except FuturesTimeout:
+        metrics.inc("server_rejected_total", reason="timeout")
+        return None, (jsonify({"error": f"Request took longer than {REQUEST_TIMEOUT:.0f}s"}), 504)
+    except Exception as e:
+        logger.error(f"Error processing request: {e}")
+        logger.error(traceback.format_exc())
+        return None, (jsonify({"error": str(e)}), 500)
+
+
+@app.route('/query', methods=['POST'])
+def handle_query():
+    """Answers one question: {"query", "answer", "entities", "sources", "timings", "tokens", "models"}."""
+    data, engine, error = _parse_request()
+    if error: return error
+    query_text = (data.get("query") or "").strip()
+    if not query_text:
+        return jsonify({"error": "No query provided"}), 400
+
+    result, error = _run_limited(engine.ask_detailed, query_text, int(data.get("top_k", 5)))
+    if error: return error
+    return jsonify(result)
+
+
+@app.route('/batch', methods=['POST'])
+def handle_batch():
+    """Answers a list of questions with engine.ask_many (one slot for the whole batch)."""
+    data, engine, error = _parse_request()
+    if error: return error
+    queries = [q.strip() for q in data.get("queries") or [] if isinstance(q, str) and q.strip()]
+    if not queries:
+        return jsonify({"error": "No queries provided"}), 400
+    if len(queries) > MAX_BATCH:
+        return jsonify({"error": f"At most {MAX_BATCH} queries per batch"}), 400
+
+    concurrency = min(int(data.get("concurrency", 4)), MAX_CONCURRENT)
+    results, error = _run_limited(engine.ask_many, queries, concurrency, int(data.get("top_k", 5)))
+    if error: return error
+    return jsonify({"results": results})
+
+
+@app.route('/stream', methods=['POST'])
+def handle_stream():
+    """Server-sent events: 'context' once retrieval is done, 'token' per answer chunk, then 'done' (or 'error')."""
+    data, engine, error = _parse_request()
+    if error: return error
+    query_text = (data.get("query") or "").strip()
+    if not query_text:
+        return jsonify({"error": "No query provided"}), 400
+    if not slots.acquire(timeout=QUEUE_TIMEOUT):
+        metrics.inc("server_rejected_total", reason="busy")
+        return jsonify({"error": "Server busy, try again later"}), 429
+
+    top_k = int(data.get("top_k", 5))
+    events_queue = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        # Runs on the worker pool, so the request thread can wait for each event with a deadline
+        stream = None
+        try:
+            stream = engine.ask_stream(query_text, top_k=top_k)
+            for event in stream:
+                events_queue.put(event)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            events_queue.put({"event": "error", "error": str(e)})
+        finally:
+            if stream is not None: stream.close()
+            events_queue.put(None)
+
+    # Like _run_limited: the slot is held until the engine really stops, even after the client got its timeout
+    future = workers.submit(produce)
+    future.add_done_callback(lambda _: slots.release())
+
+    def events():
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+        try:
+            while True:
+                try:
+                    event = events_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    # Also covers a slow retrieval or a stalled first LLM chunk, not only a slow stream
+                    metrics.inc("server_rejected_total", reason="timeout")
+                    yield f"event: error\ndata: {json.dumps({'error': 'timeout'})}\n\n"
+                    return
+                if event is None:
+                    return
+                yield f"event: {event.pop('event')}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            stop.set()
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(stop.set)
+    return response
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process answers."""
+    return jsonify({"status": "ok", "started_at": state["started_at"]})
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: only 200 once warmup has finished."""
+    body = {"ready": state["ready"], "engines": list(engines), "ready_at": state["ready_at"], "error": state["error"]}
+    return jsonify(body), 200 if state["ready"] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.to_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the Hybrid Retrieval Engines over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT, help="Questions answered at the same time")
+    parser.add_argument("--queue-timeout", type=float, default=QUEUE_TIMEOUT, help="Seconds to wait for a free slot")
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT, help="Seconds before a request fails with 504")
+    parser.add_argument("--ollama", action="store_true", help="Use local Ollama instead of Gemini")
+    parser.add_argument("--graph-snapshot", help="Answer graph lookups from this snapshot file (see graph_snapshot.py)")
+    parser.add_argument("--metrics-log-interval", type=float, default=0, help="Log a JSON metrics snapshot every N seconds (0 = off)")
+    args = parser.parse_args()
+
+    MAX_CONCURRENT = args.max_concurrent
+    QUEUE_TIMEOUT = args.queue_timeout
+    REQUEST_TIMEOUT = args.request_timeout
+    slots = threading.BoundedSemaphore(MAX_CONCURRENT)
+    workers = ThreadPoolExecutor(max_workers=MAX_CONCURRENT, thread_name_prefix="engine")
+    if args.metrics_log_interval > 0:
+        metrics.start_json_logging(args.metrics_log_interval)
+
+    print("🌍 Climate Rights Retrieval Server")
+    print("=" * 50)
+    # Warm up in the background so /health answers straight away and /ready flips when done
+    threading.Thread(target=warm_up, args=(args.ollama, args.graph_snapshot), daemon=True).start()
+
+    print(f"🔗 http://{args.host}:{args.port}")
+    print("📚 API endpoints:")
+    print("   • POST /query  - One question")
+    print("   • POST /batch  - List of questions")
+    print("   • POST /stream - One question, streamed (SSE)")
+    print("   • GET /health, /ready, /metrics")
+    print("=" * 50)
+
+    app.run(host=args.host, port=args.port, debug=False, use_reloader=False, threaded=True)